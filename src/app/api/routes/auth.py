@@ -4,19 +4,22 @@ from typing import Dict
 from urllib.parse import urlencode
 
 import requests
-from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 
+from src.app.api.routes.chat import DEFAULT_USER_ID
+from src.app.services.warmup import warm_up_user
+from src.app.utils.env import load_env
 
-load_dotenv()
+load_env()
 
 APP_CLIENT_ID = os.getenv("APP_CLIENT_ID")
 APP_CLIENT_SECRET = os.getenv("APP_CLIENT_SECRET")
 REDIRECT_URI = "http://localhost:8000/auth/exchange-token"
 GET_AUTH_URL_NAME = "get_auth_url"
 CHAT_PAGE = "/chat-ui"
+TOKEN_EXCHANGE_TIMEOUT = 10
 
 router = APIRouter()
 
@@ -46,7 +49,7 @@ def exchange_code_for_tokens(auth_code: str) -> Dict:
         "grant_type": "authorization_code",
     }
 
-    response = requests.post(url, data=data)
+    response = requests.post(url, data=data, timeout=TOKEN_EXCHANGE_TIMEOUT)
     if response.status_code == 200:
         return response.json()
     else:
@@ -72,7 +75,7 @@ async def get_auth_url():
 
 
 @router.get("/exchange-token", response_model=AuthResponse)
-async def exchange_token(request: Request):
+async def exchange_token(request: Request, background_tasks: BackgroundTasks):
     """
     Handles the exchange of authorization code for access and refresh tokens.
     This is the endpoint that handles the redirect from Strava with the 'code' in the URL.
@@ -92,6 +95,9 @@ async def exchange_token(request: Request):
     with open("token_storage.json", "w") as f:
         json.dump(token_storage, f)
 
+    # Start getting the chat ready while the browser follows the redirect
+    background_tasks.add_task(warm_up_user, DEFAULT_USER_ID)
+
     # Redirect to the agent page to start actaually doing stuff
     return RedirectResponse(url=CHAT_PAGE, status_code=303)
 
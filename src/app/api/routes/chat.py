@@ -1,14 +1,27 @@
+import asyncio
 import json
 import logging
-
-from fastapi import APIRouter, Depends, HTTPException
+import math
+import os
+from collections import deque
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from langgraph.types import Command
+from starlette.background import BackgroundTask
 
 from src.app.models.chat import ChatMessage, ChatResponse
-from src.app.services.chatbot.graph import get_chat_graph
 from src.app.services.chatbot.tools import TOOL_CALL_MESSAGES
+from src.app.services.scheduler import QueueFull, get_scheduler, user_runs
+from src.app.utils.deadline import DeadlineExceeded
 from src.app.utils.logger import setup_logger
 
 logger = setup_logger(name="chat_app", level=logging.INFO, log_file="chat.log")
@@ -16,16 +29,71 @@ logger = setup_logger(name="chat_app", level=logging.INFO, log_file="chat.log")
 router = APIRouter()
 
 
+def get_chat_graph(user_id: str):
+    """
+    Imports the chat graph (and with it langchain/langgraph/openai) on first use rather
+    than when the app starts.
+    """
+    from src.app.services.chatbot.graph import get_chat_graph
+
+    return get_chat_graph(user_id)
+
+
 class User(BaseModel):
     id: str
 
 
-def get_current_user() -> User:
+DEFAULT_USER_ID = "test-user-1"
+
+
+def get_current_user(x_user_id: Optional[str] = Header(None)) -> User:
     """
     TODO: this needs proper filling in if I want to host the app for many users.
     We also need to pass it in loads of different places... frontend needs it, backend needs it, etc.
+    For now the `X-User-Id` header lets the load tests simulate several users. It's only
+    honoured when `TRUST_USER_ID_HEADER` is set, otherwise anyone could pick a user.
+    """
+    if x_user_id and os.getenv("TRUST_USER_ID_HEADER"):
+        return User(id=x_user_id)
+    return User(id=DEFAULT_USER_ID)
+
+
+# Suggested wait when the user's previous message is still being answered
+BUSY_RETRY_AFTER = 2
+
+
+def admission_error(user_id: str) -> Optional[Dict]:
+    """
+    Starts a graph run for the user, or explains why it can't start yet: either their
+    previous run is still going (runs on the same thread would race), or the model and
+    tool call queue is full. Callers must `user_runs.finish` a run that was started.
+
+    Returns:
+        Optional[Dict]: None if the run was started, otherwise the error and how many
+            seconds to wait before retrying.
     """
-    return User(id="test-user-1")
+    if not user_runs.try_start(user_id):
+        return {
+            "error": "Still working on your previous message",
+            "retry_after": BUSY_RETRY_AFTER,
+        }
+    scheduler = get_scheduler()
+    if scheduler.is_full():
+        user_runs.finish(user_id)
+        return {
+            "error": "The assistant is busy, please try again shortly",
+            "retry_after": scheduler.retry_after(),
+        }
+    return None
+
+
+def admit_or_429(user_id: str) -> None:
+    if error := admission_error(user_id):
+        raise HTTPException(
+            status_code=429,
+            detail=error["error"],
+            headers={"Retry-After": str(math.ceil(error["retry_after"]))},
+        )
 
 
 @router.post("/message_stream")
@@ -36,6 +104,7 @@ async def send_message_stream(
     Streaming version of the message endpoint. Sends incremental updates to the frontend,
     including tool execution status messages.
     """
+    admit_or_429(current_user.id)
     try:
 
         async def generate_response():
@@ -43,7 +112,9 @@ async def send_message_stream(
                 graph = get_chat_graph(current_user.id)
                 current_message = ""
 
-                async for chunk in graph.process_message_stream(message.content):
+                async for chunk in graph.process_message_stream(
+                    message.content, stream_mode=("values", "messages", "custom")
+                ):
                     if not isinstance(chunk, tuple):
                         logger.error(f"Unexpected chunk format: {chunk}")
                         continue
@@ -62,6 +133,9 @@ async def send_message_stream(
                                         json.dumps({"message": current_message}) + "\n"
                                     )
 
+                        elif chunk_type == "custom":
+                            yield json.dumps(progress_event(chunk_data)) + "\n"
+
                         elif chunk_type == "values":
                             logger.debug(
                                 f"Processing chunk - type: {chunk_type}, data: {chunk_data}"
@@ -109,13 +183,29 @@ async def send_message_stream(
                         + "\n"
                     )
 
+            except QueueFull as e:
+                yield json.dumps({"error": str(e), "retry_after": e.retry_after}) + "\n"
+
+            except asyncio.CancelledError:
+                # StreamingResponse cancels this generator when the client disconnects,
+                # which cancels the graph run and stops its tool calls
+                logger.info(f"Client disconnected, cancelled run for {current_user.id}")
+                raise
+
             except Exception as e:
                 logger.error(f"Streaming error: {e}")
                 yield json.dumps({"error": str(e)}) + "\n"
 
-        return StreamingResponse(generate_response(), media_type="text/event-stream")
+        # the background task runs once the response is over, even if the client
+        # disconnected before the stream started
+        return StreamingResponse(
+            generate_response(),
+            media_type="text/event-stream",
+            background=BackgroundTask(user_runs.finish, current_user.id),
+        )
 
     except Exception as e:
+        user_runs.finish(current_user.id)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -126,18 +216,184 @@ class ConfirmationRequest(BaseModel):
 
 @router.post("/confirm")
 async def confirm_tool_call(request: ConfirmationRequest):
+    admit_or_429(request.user_id)
     graph = get_chat_graph(request.user_id)
-    thread_config = {"configurable": {"thread_id": "1"}}
 
-    # Resume the graph with the confirmation
-    response = await graph.graph.ainvoke(
-        Command(resume={"confirmed": request.confirmed}), config=thread_config
-    )
-    latest_message = response["messages"][-1]
+    # Resume the graph with the confirmation, through the stream so that the run gets
+    # the same deadline and cancellation handling as every other one
+    try:
+        async for _ in graph.resume_stream(request.confirmed, ("values",)):
+            pass
+        state = await graph.graph.aget_state(graph.config)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except DeadlineExceeded as e:
+        # the tool calls that didn't run have been answered, so the chat can go on
+        logger.error(f"Confirmed run took too long: {e}")
+        return ChatResponse(error=str(e))
+    except Exception as e:
+        logger.error(f"Error resuming after confirmation: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        user_runs.finish(request.user_id)
+    latest_message = state.values["messages"][-1]
     logger.info(f"Response from graph, after human confirmation: {latest_message}")
     return ChatResponse(message=latest_message.content, interrupt=False)
 
 
+def progress_event(progress: Dict) -> Dict:
+    """
+    The event sent to the frontend for progress reported from inside a tool: a status
+    message replacing the tool's generic one, plus partial results such as streets.
+    """
+    event = {"tool_status": progress["message"]}
+    if progress.get("streets"):
+        event["streets"] = progress["streets"]
+    return event
+
+
+async def stream_events(stream: AsyncIterator) -> AsyncIterator[Dict]:
+    """
+    Translates a graph stream (in "updates", "messages" and "custom" modes) into the
+    events sent to the frontend: the reply so far as it is generated, tool status and
+    progress messages, interrupts as soon as the graph pauses, and a final `done`
+    event otherwise.
+    """
+    current_message = ""
+    interrupted = False
+    async for chunk_type, chunk_data in stream:
+        if interrupted:
+            # keep reading until the graph run finishes on its own, closing the stream
+            # early would look like the client went away and cancel the run
+            continue
+
+        if chunk_type == "messages":
+            message_chunk, metadata = chunk_data
+            # only stream the chatbot's reply, not LLM calls made from inside tools
+            if metadata.get("langgraph_node") == "chatbot" and message_chunk.content:
+                current_message += message_chunk.content
+                yield {"message": current_message}
+
+        elif chunk_type == "custom":
+            yield progress_event(chunk_data)
+
+        elif chunk_type == "updates":
+            if "__interrupt__" in chunk_data:
+                interrupt = chunk_data["__interrupt__"][0]
+                yield {"message": interrupt.value["question"], "interrupt": True}
+                interrupted = True
+                continue
+
+            if chunk_data.get("chatbot"):
+                last_message = chunk_data["chatbot"]["messages"][-1]
+                if getattr(last_message, "tool_calls", None):
+                    tool_name = last_message.tool_calls[0]["name"]
+                    logger.info(f"Tool calls detected: {last_message.tool_calls}")
+                    yield {"tool_status": TOOL_CALL_MESSAGES.get(tool_name, "")}
+                    current_message = ""
+                else:
+                    current_message = last_message.content
+
+    if not interrupted:
+        yield {"message": current_message, "done": True}
+
+
+async def _send_events(
+    websocket: WebSocket, stream: AsyncIterator, user_id: str
+) -> None:
+    try:
+        async for event in stream_events(stream):
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        raise
+    except QueueFull as e:
+        await websocket.send_json({"error": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        logger.error(f"Streaming error: {e}")
+        await websocket.send_json({"error": str(e)})
+    finally:
+        user_runs.finish(user_id)
+
+
+async def _receive_json(websocket: WebSocket) -> Optional[Dict]:
+    """
+    The next message from the client, or None if it isn't a JSON object. Raises
+    `WebSocketDisconnect` if the client has gone.
+    """
+    try:
+        data = await websocket.receive_json()
+    except (json.JSONDecodeError, UnicodeDecodeError, KeyError):
+        # KeyError for a binary frame, which has no text
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, current_user=Depends(get_current_user)):
+    """
+    Chat over a single WebSocket. The client sends `{"content": ...}` to chat and
+    `{"confirmed": true|false}` to answer an interrupt. Both stream events back as
+    they happen, so an update flow needs no extra requests.
+    """
+    await websocket.accept()
+    graph = get_chat_graph(current_user.id)
+    stream_mode = ["updates", "messages", "custom"]
+
+    # keep listening while a run streams, so a disconnect cancels the run (and its
+    # tool calls) straight away instead of when the next event fails to send
+    pending = deque()
+    receive = asyncio.ensure_future(_receive_json(websocket))
+    run = None
+    try:
+        while True:
+            if not pending:
+                pending.append(await receive)
+                receive = asyncio.ensure_future(_receive_json(websocket))
+            data = pending.popleft()
+
+            if data is None:
+                await websocket.send_json({"error": "Messages must be JSON objects"})
+                continue
+            if "content" in data:
+                stream = graph.process_message_stream(data["content"], stream_mode)
+            elif "confirmed" in data:
+                stream = graph.resume_stream(bool(data["confirmed"]), stream_mode)
+            else:
+                await websocket.send_json(
+                    {"error": "Expected `content` or `confirmed`"}
+                )
+                continue
+
+            if error := admission_error(current_user.id):
+                await stream.aclose()
+                await websocket.send_json(error)
+                continue
+
+            run = asyncio.ensure_future(
+                _send_events(websocket, stream, current_user.id)
+            )
+            while not run.done():
+                await asyncio.wait({run, receive}, return_when=asyncio.FIRST_COMPLETED)
+                if receive.done():
+                    # raises WebSocketDisconnect if the client has gone
+                    pending.append(receive.result())
+                    receive = asyncio.ensure_future(_receive_json(websocket))
+            run.result()
+
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket closed for user {current_user.id}")
+
+    finally:
+        receive.cancel()
+        if run is not None and not run.done():
+            logger.info(f"Cancelling the graph run for user {current_user.id}")
+            run.cancel()
+
+
 # This function is not used in the current implementation. It works in conjunction
 # with `static/old_scripts.js`.
 @router.post("/message_static", response_model=ChatResponse)
@@ -149,6 +405,7 @@ async def send_message_static(
     the front-end for user display. This function handles messages sent from the agent
     graph, and works out what messages (ChatResponse) should be sent back to the user.
     """
+    admit_or_429(current_user.id)
     try:
         graph = get_chat_graph(current_user.id)
         final_message = ""
@@ -213,3 +470,17 @@ async def send_message_static(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    finally:
+        user_runs.finish(current_user.id)
+
+
+@router.get("/models")
+async def get_model_usage():
+    """The model configured for each role, and the latency and cost of calls so far."""
+    from src.app.services.chatbot.models import MODEL_TIERS, get_tier, model_usage
+
+    return {
+        "tiers": {role: vars(get_tier(role)) for role in MODEL_TIERS},
+        "usage": model_usage.summary(),
+    }
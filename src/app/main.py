@@ -1,3 +1,8 @@
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -5,8 +10,37 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 from src.app.api.routes import auth, chat
+from src.app.utils.env import load_env
+from src.app.utils.logger import setup_logger
 
-app = FastAPI(title="Running Buddy AI Agent")
+logger = setup_logger(name="main", level=logging.INFO)
+
+# Modules that are only needed once someone starts chatting. They are imported in the
+# background after startup so that neither the boot nor the first message pays for them
+WARM_UP_MODULES = ["src.app.services.chatbot.graph"]
+
+
+async def _warm_up_imports() -> None:
+    start = time.perf_counter()
+    for module in WARM_UP_MODULES:
+        try:
+            await asyncio.to_thread(importlib.import_module, module)
+        except Exception as e:
+            logger.warning(f"Failed to warm up {module}: {e}")
+    logger.info(
+        f"Warmed up chat modules in {(time.perf_counter() - start) * 1000:.0f}ms"
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_env()
+    warm_up = asyncio.create_task(_warm_up_imports())
+    yield
+    warm_up.cancel()
+
+
+app = FastAPI(title="Running Buddy AI Agent", lifespan=lifespan)
 
 # Set up the paths for static files
 BASE_DIR = Path(__file__).resolve().parent
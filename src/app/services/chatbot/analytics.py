@@ -0,0 +1,238 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def _parse_runs(activities: List[Dict], activity_type: str) -> List[Dict]:
+    """
+    Flatten raw Strava activities into the few columns the aggregations need,
+    sorted by start date.
+    """
+    rows = []
+    for activity in activities:
+        if activity_type and activity.get("type") != activity_type:
+            continue
+        distance = float(activity.get("distance") or 0.0)
+        moving_time = int(activity.get("moving_time") or 0)
+        start = datetime.fromisoformat(
+            activity["start_date_local"].replace("Z", "+00:00")
+        )
+        rows.append(
+            {
+                "id": activity.get("id"),
+                "name": activity.get("name", ""),
+                "day": start.date(),
+                "km": distance / 1000,
+                "seconds": moving_time,
+                "elevation": float(activity.get("total_elevation_gain") or 0.0),
+            }
+        )
+    return sorted(rows, key=lambda row: row["day"])
+
+
+def _format_pace(seconds_per_km: Optional[float]) -> str:
+    if not seconds_per_km:
+        return "-"
+    minutes, seconds = divmod(int(round(seconds_per_km)), 60)
+    return f"{minutes}:{seconds:02d}/km"
+
+
+def _format_duration(seconds: int) -> str:
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def _table(headers: List[str], rows: Iterable[Iterable]) -> str:
+    lines = ["| " + " | ".join(headers) + " |", "|" + "---|" * len(headers)]
+    lines += ["| " + " | ".join(str(cell) for cell in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def _group_volume(rows: List[Dict], key) -> List[Tuple[str, int, float, int]]:
+    """
+    Group runs by `key(day)` and return (period, count, km, seconds) per period in
+    date order.
+    """
+    groups: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0, 0])
+    for row in rows:
+        group = groups[key(row["day"])]
+        group[0] += 1
+        group[1] += row["km"]
+        group[2] += row["seconds"]
+    return [(period, *totals) for period, totals in groups.items()]
+
+
+def _week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def _weekly_volume(rows: List[Dict]) -> List[Tuple[str, int, float, int]]:
+    """
+    Volume per week (keyed by the Monday the week starts on), including weeks without
+    any runs so that gaps show up as zeros rather than disappearing.
+    """
+    volume = {
+        group[0]: group
+        for group in _group_volume(rows, lambda d: _week_start(d).isoformat())
+    }
+    week, last_week = _week_start(rows[0]["day"]), _week_start(rows[-1]["day"])
+    weekly = []
+    while week <= last_week:
+        weekly.append(volume.get(week.isoformat(), (week.isoformat(), 0, 0.0, 0)))
+        week += timedelta(weeks=1)
+    return weekly
+
+
+def _pace_trend(weekly: List[Tuple[str, int, float, int]]) -> Optional[float]:
+    """
+    Least-squares slope of weekly average pace, in seconds per km per week. Negative
+    means the athlete is getting faster. Weeks without runs are left out, but still
+    count towards the time between the weeks around them.
+    """
+    first_week = date.fromisoformat(weekly[0][0])
+    points = [
+        ((date.fromisoformat(week) - first_week).days / 7, seconds / km)
+        for week, _, km, seconds in weekly
+        if km
+    ]
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    cov_xy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    return cov_xy / var_x
+
+
+def _streaks(days: List[date], today: date) -> Tuple[int, int]:
+    """
+    Returns the current and longest streaks of consecutive days with an activity.
+    """
+    unique_days = sorted(set(days))
+    longest = current = 0
+    previous = None
+    for day in unique_days:
+        current = current + 1 if previous and day - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = day
+
+    # the current streak only counts if it is still alive (ran today or yesterday)
+    if not previous or today - previous > timedelta(days=1):
+        current = 0
+    return current, longest
+
+
+def summarise_activities(
+    activities: List[Dict],
+    activity_type: str = "Run",
+    today: Optional[date] = None,
+) -> str:
+    """
+    Compute weekly and monthly volume, pace trend, personal bests and streaks over a
+    list of Strava activities.
+
+    Args:
+        activities (List[Dict]): Activities as returned by the Strava API.
+        activity_type (str): Only activities of this type are included. Default is "Run".
+        today (date): Reference date for the current streak. Defaults to today.
+
+    Returns:
+        str: A few small markdown tables summarising the activities.
+    """
+    rows = _parse_runs(activities, activity_type)
+    if not rows:
+        return f"No {activity_type} activities found."
+
+    today = today or date.today()
+    weekly = _weekly_volume(rows)
+    monthly = _group_volume(rows, lambda d: d.strftime("%Y-%m"))
+
+    sections = [
+        f"{len(rows)} {activity_type} activities from {rows[0]['day']} to {rows[-1]['day']}",
+        "Weekly volume (week starting):",
+        _table(
+            ["Week", "Runs", "Distance", "Time", "Avg pace"],
+            [
+                (
+                    p,
+                    n,
+                    f"{km:.1f} km",
+                    _format_duration(s),
+                    _format_pace(s / km if km else None),
+                )
+                for p, n, km, s in weekly
+            ],
+        ),
+        "Monthly volume:",
+        _table(
+            ["Month", "Runs", "Distance", "Time", "Avg pace"],
+            [
+                (
+                    p,
+                    n,
+                    f"{km:.1f} km",
+                    _format_duration(s),
+                    _format_pace(s / km if km else None),
+                )
+                for p, n, km, s in monthly
+            ],
+        ),
+    ]
+
+    trend = _pace_trend(weekly)
+    if trend is None:
+        sections.append("Pace trend: not enough weeks of data.")
+    else:
+        direction = "faster" if trend < 0 else "slower"
+        sections.append(
+            f"Pace trend: {abs(trend):.1f} s/km per week {direction} across {len(weekly)} weeks."
+        )
+
+    paced = [row for row in rows if row["km"] >= 1 and row["seconds"]]
+    fastest = min(paced, key=lambda row: row["seconds"] / row["km"], default=None)
+    longest = max(rows, key=lambda row: row["km"])
+    longest_time = max(rows, key=lambda row: row["seconds"])
+    hilliest = max(rows, key=lambda row: row["elevation"])
+    bests = [
+        (
+            "Longest distance",
+            f"{longest['km']:.2f} km",
+            longest["day"],
+            longest["name"],
+        ),
+        (
+            "Longest time",
+            _format_duration(longest_time["seconds"]),
+            longest_time["day"],
+            longest_time["name"],
+        ),
+        (
+            "Most elevation",
+            f"{hilliest['elevation']:.0f} m",
+            hilliest["day"],
+            hilliest["name"],
+        ),
+    ]
+    if fastest:
+        bests.insert(
+            1,
+            (
+                "Fastest avg pace (1 km+)",
+                _format_pace(fastest["seconds"] / fastest["km"]),
+                fastest["day"],
+                fastest["name"],
+            ),
+        )
+    sections += [
+        "Personal bests:",
+        _table(["Record", "Value", "Date", "Activity"], bests),
+    ]
+
+    current, longest_streak = _streaks([row["day"] for row in rows], today)
+    sections.append(
+        f"Streaks: current {current} day(s), longest {longest_streak} day(s)."
+    )
+
+    return "\n\n".join(sections)
@@ -1,23 +1,45 @@
+import asyncio
 import logging
-from typing import AsyncIterator, Dict, Optional
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set
 from dataclasses import dataclass
 
-from langchain_core.messages import SystemMessage
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableConfig
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 from typing_extensions import Annotated, TypedDict
-from langgraph.types import interrupt
+from langgraph.types import Command, StreamWriter, interrupt
 
+from src.app.services.chatbot import planner, tools
+from src.app.services.chatbot.models import get_model
 from src.app.services.chatbot.prompts import SYSTEM_INSTRUCTIONS
+from src.app.services.scheduler import QueueFull, get_scheduler
 from src.app.services.chatbot.tools import get_tools
+from src.app.utils.cancellation import new_cancellation_scope
+from src.app.utils.deadline import DeadlineExceeded, call_timeout, start_deadline
 from src.app.utils.logger import setup_logger
+from src.app.utils.progress import progress_scope
 
 logger = setup_logger(name="graph", level=logging.INFO, log_file="graph.log")
 
-MODEL_NAME = "gpt-4o-mini"
+# Upper bound on a single model call, it gets shorter as the turn's deadline nears
+LLM_TIMEOUT = 30.0
+
+# Once these tools have run, the next reply is the creative one (the poem) and goes to
+# the writer model
+WRITER_TOOLS = {"enrich_activity"}
+
+# Tools that need human confirmation before they are run
+CONFIRMATION_TOOLS = {"update_activity", "update_activities"}
 
 
 @dataclass
@@ -41,13 +63,61 @@ class ChatGraph:
         """
         self.user_id = user_id
         self.tools = get_tools()  # TODO: may need to pass user_id to this one day, so that I fetch the correct StravaClient token
-        self.llm = ChatOpenAI(model=MODEL_NAME)
-        self.llm_with_tools = self.llm.bind_tools(self.tools)
+        self.models = {
+            role: get_model(
+                role, LLM_TIMEOUT, prepare=lambda llm: llm.bind_tools(self.tools)
+            )
+            for role in ("router", "writer")
+        }
+        self.tool_node = ToolNode(tools=self.tools)
         self.system_message = SystemMessage(content=SYSTEM_INSTRUCTIONS)
         self.config = {"configurable": {"thread_id": "1"}}
         self.graph = self._build_graph()
+        self._recovery: Optional[asyncio.Task] = None
+        # answers to the current tools step so far, and the calls that got a slot, so a
+        # failed step can keep what did run (see `answer_dangling_tool_calls`)
+        self._tool_results: Dict[str, ToolMessage] = {}
+        self._tool_calls_started: Set[str] = set()
+
+    async def _planner_node(self, state: State, writer: StreamWriter) -> Dict:
+        """
+        Run the tools for well known requests (currently a poem about a run) in one
+        step, so the chatbot is only called once the data is ready.
+        """
+        messages = state["messages"]
+        if not planner.is_enabled() or not planner.is_poem_request(messages):
+            return {"messages": []}
 
-    def _chatbot_node(self, state: State) -> Dict:
+        logger.info("Poem request detected, running the planned tool pipeline")
+        try:
+            async with get_scheduler().slot(self.user_id):
+                with progress_scope(writer, "poem_pipeline"):
+                    return {
+                        "messages": await planner.run_poem_pipeline(
+                            messages[-1].content
+                        )
+                    }
+        except (QueueFull, DeadlineExceeded):
+            raise
+        except Exception as e:
+            # fall back to letting the chatbot call the tools one by one
+            logger.error(f"Planned pipeline failed, falling back to the chatbot: {e}")
+            return {"messages": []}
+
+    @staticmethod
+    def _model_role(messages: List) -> str:
+        """
+        Which model should reply: the writer when this turn's tools have gathered what
+        it needs for a creative reply, otherwise the (cheaper, faster) router.
+        """
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, ToolMessage) and message.name in WRITER_TOOLS:
+                return "writer"
+        return "router"
+
+    async def _chatbot_node(self, state: State) -> Dict:
         """
         Process messages through the chatbot.
         """
@@ -58,40 +128,170 @@ class ChatGraph:
             messages = [self.system_message] + messages
 
         try:
-            response = self.llm_with_tools.invoke(messages)
+            # async, so that cancelling the run also aborts the request to OpenAI
+            async with get_scheduler().slot(self.user_id):
+                # leaves room for a fallback if the first model fails. Worked out before
+                # the call is created, as it raises if the turn is already out of time
+                timeout = call_timeout(2 * LLM_TIMEOUT)
+                response = await asyncio.wait_for(
+                    self.models[self._model_role(messages)].ainvoke(messages),
+                    timeout=timeout,
+                )
             return {"messages": [response]}
 
+        except (QueueFull, DeadlineExceeded):
+            raise
+
+        except TimeoutError:
+            raise DeadlineExceeded("The assistant took too long to reply")
+
         except Exception as e:
             raise Exception(f"Error in chatbot processing: {str(e)}")
 
-    def _tool_node(self, state: State) -> Dict:
+    async def _run_tool_call(
+        self, tool_call: Dict, config: RunnableConfig, writer: StreamWriter
+    ) -> List:
+        """
+        Run a single tool call through the shared ToolNode and log how long it took.
+        Progress the tool reports is streamed in the "custom" stream mode.
+        """
+        async with get_scheduler().slot(self.user_id):
+            self._tool_calls_started.add(tool_call["id"])
+            start = time.perf_counter()
+            with progress_scope(writer, tool_call["name"]):
+                result = await self.tool_node.ainvoke(
+                    {"messages": [AIMessage(content="", tool_calls=[tool_call])]},
+                    config,
+                )
+        duration_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"Tool call {tool_call['name']} took {duration_ms:.0f}ms")
+
+        messages = result["messages"]
+        for message in messages:
+            message.response_metadata["duration_ms"] = round(duration_ms)
+            self._tool_results[message.tool_call_id] = message
+        return messages
+
+    @staticmethod
+    def _confirmation_question(guarded_calls: List[Dict]) -> str:
+        """
+        One question covering every guarded call, listing the activities and their new
+        descriptions when more than one activity would be updated.
+        """
+        updates = []
+        for call in guarded_calls:
+            if call["name"] == "update_activities":
+                updates += [
+                    (u.get("activity_id"), u.get("new_description", ""))
+                    for u in call["args"].get("updates", [])
+                ]
+            else:
+                updates.append((None, call["args"].get("new_description", "")))
+
+        if len(updates) <= 1:
+            return "Would you like to proceed with updating the activity?"
+
+        lines = [
+            f"Would you like to proceed with updating these {len(updates)} activities?"
+        ]
+        for activity_id, description in updates:
+            first_line = description.strip().split("\n")[0]
+            preview = first_line[:60] + ("..." if len(first_line) > 60 else "")
+            lines.append(f"- {activity_id or 'Selected activity'}: {preview}")
+        return "\n".join(lines)
+
+    async def _tool_node(
+        self, state: State, config: RunnableConfig, writer: StreamWriter
+    ) -> Dict:
         messages = state["messages"]
         last_message = messages[-1]
-
-        if hasattr(last_message, "tool_calls") and len(last_message.tool_calls) > 0:
-            for tool_call in last_message.tool_calls:
-                if tool_call["name"] == "update_activity":
-                    logger.info(
-                        "Detected an update_activity call, interrupting the graph flow!"
+        tool_calls = getattr(last_message, "tool_calls", None) or []
+
+        # Ask for confirmation before running anything: the node is re-run from the
+        # start when the graph resumes, so tools executed before `interrupt` would run
+        # twice.
+        guarded_calls = [c for c in tool_calls if c["name"] in CONFIRMATION_TOOLS]
+
+        # bulk updates that would be refused are answered straight away, rather than
+        # asking the user to confirm them first
+        rejected_messages = []
+        for call in guarded_calls:
+            if call["name"] != "update_activities":
+                continue
+            error = tools.bulk_update_error(call["args"].get("updates", []))
+            if error is not None:
+                rejected_messages.append(
+                    ToolMessage(
+                        content=error, name=call["name"], tool_call_id=call["id"]
                     )
-                    state["interrupt"] = {
-                        "question": "Would you like to proceed with updating the activity?",
-                        "tool_call": tool_call,
-                    }
-                    response = interrupt(state["interrupt"])
-                    logger.info(
-                        f"Resuming after human review in _tool_node: {response}"
+                )
+        rejected_ids = {m.tool_call_id for m in rejected_messages}
+        guarded_calls = [c for c in guarded_calls if c["id"] not in rejected_ids]
+        tool_calls = [c for c in tool_calls if c["id"] not in rejected_ids]
+
+        declined_messages = []
+        if guarded_calls:
+            logger.info(
+                f"Detected {len(guarded_calls)} guarded tool call(s), interrupting the graph flow!"
+            )
+            state["interrupt"] = {
+                "question": self._confirmation_question(guarded_calls),
+                "tool_call": guarded_calls[0],
+            }
+            response = interrupt(state["interrupt"])
+            logger.info(f"Resuming after human review in _tool_node: {response}")
+
+            if not response.get("confirmed"):
+                # only continue with the guarded tools if the user confirmed, but every
+                # tool call still needs an answer for the chatbot to carry on
+                declined_messages = [
+                    ToolMessage(
+                        content="The user declined this action.",
+                        name=c["name"],
+                        tool_call_id=c["id"],
                     )
-
-                    if response.get("confirmed"):
-                        # only continue with the tools if the user confirmed
-                        return ToolNode(tools=self.tools).invoke(state)
-
-                    # otherwise, just return current state and continue with the chatbot
-                    return {"messages": messages}
-
-        # invoke tools as per usual if no interruption needed
-        return ToolNode(tools=self.tools).invoke(state)
+                    for c in guarded_calls
+                ]
+                tool_calls = [c for c in tool_calls if c not in guarded_calls]
+
+        self._tool_results = {
+            m.tool_call_id: m for m in rejected_messages + declined_messages
+        }
+        self._tool_calls_started = set()
+
+        # independent tool calls from the same message run concurrently
+        start = time.perf_counter()
+        tasks = [
+            asyncio.create_task(self._run_tool_call(tool_call, config, writer))
+            for tool_call in tool_calls
+        ]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            failed = next((t for t in tasks if t.done() and t.exception()), None)
+            if failed is not None:
+                # calls still waiting for a slot are dropped, but calls that are already
+                # running are left to finish, so that what they did is recorded
+                for tool_call, task in zip(tool_calls, tasks):
+                    if tool_call["id"] not in self._tool_calls_started:
+                        task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise failed.exception()
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        results = [task.result() for task in tasks]
+        if len(tool_calls) > 1:
+            logger.info(
+                f"Ran {len(tool_calls)} tool calls in {(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+
+        return {
+            "messages": [m for result in results for m in result]
+            + rejected_messages
+            + declined_messages
+        }
 
     def _select_next_node(self, state: State) -> str:
         """
@@ -122,6 +322,7 @@ class ChatGraph:
         graph_builder = StateGraph(State)
 
         # Add nodes to the graph
+        graph_builder.add_node("planner", self._planner_node)
         graph_builder.add_node("chatbot", self._chatbot_node)
         graph_builder.add_node("tools", self._tool_node)
 
@@ -131,40 +332,145 @@ class ChatGraph:
             "chatbot",
             self._select_next_node,
         )
+        graph_builder.add_edge("planner", "chatbot")
         graph_builder.add_edge("tools", "chatbot")
 
         # Put it all together
-        graph_builder.set_entry_point("chatbot")
+        graph_builder.set_entry_point("planner")
         return graph_builder.compile(checkpointer=MemorySaver())
 
-    async def process_message_stream(self, message: str) -> AsyncIterator[Dict]:
+    async def process_message_stream(
+        self, message: str, stream_mode: Sequence[str] = ("values", "messages")
+    ) -> AsyncIterator[Dict]:
         """
         Process a new message through the graph with streaming support.
 
         Args:
             message (str): The message to process
+            stream_mode (Sequence[str]): The graph stream modes to emit
 
         Returns:
             AsyncIterator[Dict]: Stream of updates from the graph processing
         """
-        try:
-            initial_state = {
-                "messages": [{"role": "user", "content": message}],
-            }
+        initial_state = {
+            "messages": [{"role": "user", "content": message}],
+        }
+        async for chunk in self._astream(initial_state, stream_mode):
+            yield chunk
+
+    async def resume_stream(
+        self, confirmed: bool, stream_mode: Sequence[str] = ("values", "messages")
+    ) -> AsyncIterator[Dict]:
+        """
+        Resume a graph that was interrupted for human confirmation, streaming the rest
+        of the run.
+
+        Args:
+            confirmed (bool): Whether the user confirmed the pending tool call
+            stream_mode (Sequence[str]): The graph stream modes to emit
 
-            # Stream both values and LLM messages
+        Returns:
+            AsyncIterator[Dict]: Stream of updates from the graph processing
+        """
+        async for chunk in self._astream(
+            Command(resume={"confirmed": confirmed}), stream_mode
+        ):
+            yield chunk
+
+    async def _astream(self, input, stream_mode: Sequence[str]) -> AsyncIterator[Dict]:
+        if self._recovery is not None:
+            await self._recovery
+            self._recovery = None
+
+        cancel_event = new_cancellation_scope()
+        start_deadline()
+        try:
             async for chunk in self.graph.astream(
-                initial_state, self.config, stream_mode=["values", "messages"]
+                input, self.config, stream_mode=list(stream_mode)
             ):
                 yield chunk
 
+        except (asyncio.CancelledError, GeneratorExit):
+            # the consumer went away (e.g. the client disconnected): stop tools that
+            # are still running in threads, and tidy up the checkpoint in a separate
+            # task since this one is being cancelled
+            logger.info("Graph run cancelled, stopping in-flight tool calls")
+            cancel_event.set()
+            self._recovery = asyncio.ensure_future(self.recover_after_cancel())
+            raise
+
+        except QueueFull:
+            # let the routes turn this into a "try again later" with a retry hint, which
+            # only works if the tool calls that never got a slot have been answered
+            await self.answer_dangling_tool_calls("Not run: the assistant was busy.")
+            raise
+
+        except DeadlineExceeded:
+            # out of time, don't leave tools running in threads for nothing
+            cancel_event.set()
+            await self.answer_dangling_tool_calls("Not run: the request took too long.")
+            raise
+
         except Exception as e:
+            await self.answer_dangling_tool_calls("Not run: something went wrong.")
             raise Exception(f"Error processing message stream: {str(e)}")
 
+    async def recover_after_cancel(self) -> None:
+        await self.answer_dangling_tool_calls(
+            "Cancelled: the user left before this finished."
+        )
+
+    async def answer_dangling_tool_calls(self, reason: str) -> None:
+        """
+        Leave the checkpoint in a state the conversation can carry on from after a run
+        was cancelled or failed. Steps that didn't finish are never checkpointed, but a
+        failed tools step leaves the last AI message with unanswered tool calls, which
+        OpenAI rejects on the next turn. Calls that finished before the step failed keep
+        their result, the others get a tool message with the `reason`.
+        """
+        results, self._tool_results = self._tool_results, {}
+        started, self._tool_calls_started = self._tool_calls_started, set()
+
+        state = await self.graph.aget_state(self.config)
+        if any(task.interrupts for task in state.tasks):
+            # waiting for confirmation, the run can be resumed as it is
+            return
+
+        messages = state.values.get("messages", [])
+        if not messages or not getattr(messages[-1], "tool_calls", None):
+            return
+
+        answers = []
+        for tool_call in messages[-1].tool_calls:
+            if tool_call["id"] in results:
+                answers.append(results[tool_call["id"]])
+                continue
+            answers.append(
+                ToolMessage(
+                    content=(
+                        "Stopped before it finished, it may or may not have been done."
+                        if tool_call["id"] in started
+                        else reason
+                    ),
+                    name=tool_call["name"],
+                    tool_call_id=tool_call["id"],
+                )
+            )
+        # written as the chatbot, whose edge then ends the run, so nothing is left
+        # pending for the next message
+        await self.graph.aupdate_state(
+            self.config, {"messages": answers}, as_node="chatbot"
+        )
+        logger.info(
+            f"Answered {len(answers) - len(results)} dangling tool call(s): {reason}"
+        )
+
 
 # Factory function to get or create a chat graph for multiple users
 # TODO: actually do this lol
 _user_graphs: Dict[str, ChatGraph] = {}
+# graphs can be created from a warm-up thread and a request at the same time
+_user_graphs_lock = threading.Lock()
 
 
 def get_chat_graph(user_id: str) -> ChatGraph:
@@ -177,6 +483,7 @@ def get_chat_graph(user_id: str) -> ChatGraph:
     Returns:
         ChatGraph: The chat graph instance for this user
     """
-    if user_id not in _user_graphs:
-        _user_graphs[user_id] = ChatGraph(user_id)
-    return _user_graphs[user_id]
+    with _user_graphs_lock:
+        if user_id not in _user_graphs:
+            _user_graphs[user_id] = ChatGraph(user_id)
+        return _user_graphs[user_id]
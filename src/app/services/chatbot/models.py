@@ -0,0 +1,204 @@
+"""
+Which model serves each part of the chat graph. Routing between tools and picking an
+activity are simple and latency sensitive, so they use a small fast model, while the
+creative reply at the end of a turn (e.g. the poem) uses a stronger one.
+
+Each role can be changed from the environment, e.g.:
+    MODEL_WRITER=gpt-4.1
+    MODEL_WRITER_FALLBACKS=gpt-4o,gpt-4o-mini
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+
+from src.app.utils.logger import setup_logger
+
+logger = setup_logger(name="models", level=logging.INFO, log_file="graph.log")
+
+
+@dataclass
+class ModelTier:
+    model: str
+    fallbacks: List[str] = field(default_factory=list)
+
+
+MODEL_TIERS: Dict[str, ModelTier] = {
+    # the chatbot deciding which tools to call, and answering simple questions
+    "router": ModelTier("gpt-4o-mini"),
+    # the chatbot writing its reply once the route details are in, e.g. a poem
+    "writer": ModelTier("gpt-4o", fallbacks=["gpt-4o-mini"]),
+    # picking the activity a query is about, in the select_activity tool
+    "select_activity": ModelTier("gpt-4o-mini"),
+}
+
+# USD per million (input, output) tokens, matched on the start of the model name
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+
+def get_tier(role: str) -> ModelTier:
+    """
+    The model and fallbacks for a role, with `MODEL_<ROLE>` and `MODEL_<ROLE>_FALLBACKS`
+    from the environment taking precedence over `MODEL_TIERS`.
+    """
+    default = MODEL_TIERS[role]
+    prefix = f"MODEL_{role.upper()}"
+    fallbacks = os.getenv(f"{prefix}_FALLBACKS")
+    return ModelTier(
+        model=os.getenv(prefix, default.model),
+        fallbacks=(
+            [name.strip() for name in fallbacks.split(",") if name.strip()]
+            if fallbacks is not None
+            else default.fallbacks
+        ),
+    )
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+    """The cost of a call in USD, or None if the model's price isn't known."""
+    prefixes = [prefix for prefix in MODEL_PRICES if model.startswith(prefix)]
+    if not prefixes:
+        return None
+    input_price, output_price = MODEL_PRICES[max(prefixes, key=len)]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class ModelUsage(BaseCallbackHandler):
+    """
+    Records the latency, token usage and cost of every model call, per role and model.
+    When a call falls back, the failed attempt is recorded against its own model.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # run_id -> (role, model, start time)
+        self._runs: Dict[UUID, Tuple[str, str, float]] = {}
+        self._totals: Dict[Tuple[str, str], Dict] = {}
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs
+    ) -> None:
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or metadata.get("ls_model_name") or "unknown"
+        with self._lock:
+            self._runs[run_id] = (
+                metadata.get("model_role", "unknown"),
+                model,
+                time.perf_counter(),
+            )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(
+                    getattr(generation, "message", None), "usage_metadata", None
+                )
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        self._finish(run_id, input_tokens, output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, error=error)
+
+    def _finish(
+        self,
+        run_id: UUID,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            role, model, start = run
+            duration_ms = (time.perf_counter() - start) * 1000
+            cost = estimate_cost(model, input_tokens, output_tokens)
+
+            totals = self._totals.setdefault(
+                (role, model),
+                {"calls": 0, "errors": 0, "total_ms": 0.0, "cost_usd": 0.0},
+            )
+            totals["calls"] += 1
+            totals["errors"] += error is not None
+            totals["total_ms"] += duration_ms
+            totals["cost_usd"] += cost or 0.0
+
+        if error is not None:
+            logger.warning(
+                f"Model call {role}/{model} failed after {duration_ms:.0f}ms: {error}"
+            )
+        else:
+            cost_text = f"${cost:.5f}" if cost is not None else "unknown cost"
+            logger.info(
+                f"Model call {role}/{model} took {duration_ms:.0f}ms, "
+                f"{input_tokens}+{output_tokens} tokens, {cost_text}"
+            )
+
+    def summary(self) -> List[Dict]:
+        """Totals per role and model since the process started."""
+        with self._lock:
+            return [
+                {
+                    "role": role,
+                    "model": model,
+                    "calls": totals["calls"],
+                    "errors": totals["errors"],
+                    "avg_ms": round(totals["total_ms"] / totals["calls"]),
+                    "cost_usd": round(totals["cost_usd"], 6),
+                }
+                for (role, model), totals in self._totals.items()
+            ]
+
+
+model_usage = ModelUsage()
+
+
+def get_model(
+    role: str,
+    timeout: float,
+    prepare: Optional[Callable[[Runnable], Runnable]] = None,
+) -> Runnable:
+    """
+    Build the model for a role, with its fallbacks, usage tracking attached.
+
+    Args:
+        role (str): A key of `MODEL_TIERS`.
+        timeout (float): Timeout for each attempt, fallbacks get their own.
+        prepare (Callable): Applied to every model before the fallbacks are chained,
+            e.g. to bind tools or ask for structured output.
+
+    Returns:
+        Runnable: The model, or the model with its fallbacks.
+    """
+    # imported here so that importing the tools doesn't pull in langchain_openai
+    from langchain_openai import ChatOpenAI
+
+    tier = get_tier(role)
+    models = []
+    for name in [tier.model] + tier.fallbacks:
+        # stream_usage so that token counts are reported when streaming too
+        model = ChatOpenAI(
+            model=name, timeout=timeout, max_retries=1, stream_usage=True
+        )
+        models.append(prepare(model) if prepare else model)
+
+    model = models[0].with_fallbacks(models[1:]) if len(models) > 1 else models[0]
+    return model.with_config(callbacks=[model_usage], metadata={"model_role": role})
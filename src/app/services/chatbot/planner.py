@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from src.app.services.chatbot import tools
+from src.app.services.googlemaps.client import GMapsClient
+from src.app.utils.logger import setup_logger
+from src.app.utils.progress import report_progress, without_progress
+
+logger = setup_logger(name="planner", level=logging.INFO, log_file="graph.log")
+
+POEM_PATTERN = re.compile(r"\b(poem|poetry|verse|haiku|limerick)s?\b", re.IGNORECASE)
+RUN_PATTERN = re.compile(
+    r"\b(run|ran|running|jog|jogged|activity|activities|route|strava)\b",
+    re.IGNORECASE,
+)
+# e.g. "update my activity with that poem" refers to a poem that was already written
+UPDATE_PATTERN = re.compile(
+    r"\b(update|updating|description|post|upload|save)\b", re.IGNORECASE
+)
+
+
+def is_enabled() -> bool:
+    """
+    Whether planned pipelines are used, which `PLANNER_ENABLED=false` turns off (e.g. to
+    compare latency with the chatbot calling the tools one by one).
+    """
+    return os.getenv("PLANNER_ENABLED", "true").lower() not in ("0", "false", "no")
+
+
+def is_poem_request(messages: List[BaseMessage]) -> bool:
+    """
+    Whether the latest message is a fresh request for a poem about a run, which always
+    needs the same fetch -> select -> read -> enrich chain of tools.
+    """
+    if not messages or not isinstance(messages[-1], HumanMessage):
+        return False
+    content = messages[-1].content
+    return bool(
+        POEM_PATTERN.search(content)
+        and RUN_PATTERN.search(content)
+        and not UPDATE_PATTERN.search(content)
+    )
+
+
+def _enrich_latest(activity: Dict) -> Optional[str]:
+    """
+    Speculatively enrich the latest activity, which is what `select_activity` picks
+    most of the time (and falls back to when it can't decide). Its progress isn't
+    reported, as it would show streets of the wrong run if another one gets selected.
+    """
+    try:
+        with without_progress():
+            return GMapsClient().fetch_map_details(activity["map"]["summary_polyline"])
+    except Exception as e:
+        logger.warning(f"Speculative enrichment of the latest activity failed: {e}")
+        return None
+
+
+def _tool_call(name: str, args: Dict) -> Dict:
+    return {"name": name, "args": args, "id": f"call_plan_{uuid.uuid4().hex[:16]}"}
+
+
+async def run_poem_pipeline(query: str) -> List[BaseMessage]:
+    """
+    Run the tools for a "poem about my run" request in one step, without a model round
+    trip between each of them. Enrichment of the latest activity overlaps with the
+    (LLM backed) activity selection.
+
+    Args:
+        query (str): The user's request.
+
+    Returns:
+        List[BaseMessage]: An AI message with the planned tool calls followed by their
+            tool messages, in the same shape the tools node would have produced. Empty
+            if there are no activities to write about.
+    """
+    start = time.perf_counter()
+    activities_file = await asyncio.to_thread(tools.fetch_activities, query)
+    with open(activities_file, "r") as f:
+        activities = json.load(f)
+    if not activities:
+        return []
+    report_progress(f"Found {len(activities)} activities, picking one")
+
+    latest = activities[-1]
+    (found_activity, activity_file), latest_details = await asyncio.gather(
+        asyncio.to_thread(tools.select_activity, query, activities_file),
+        asyncio.to_thread(_enrich_latest, latest),
+    )
+
+    with open(activity_file, "r") as f:
+        selected = json.load(f)
+    if selected.get("id") == latest.get("id") and latest_details is not None:
+        map_details = latest_details
+    else:
+        logger.info("Selected activity is not the latest, enriching it instead")
+        map_details = await asyncio.to_thread(tools.enrich_activity, activity_file)
+
+    calls = [
+        (_tool_call("fetch_activities", {"query": query}), activities_file),
+        (
+            _tool_call(
+                "select_activity", {"query": query, "activities_file": activities_file}
+            ),
+            json.dumps([found_activity, activity_file]),
+        ),
+        (
+            _tool_call("read_activity", {"activity_file": activity_file}),
+            tools.read_activity(activity_file),
+        ),
+        (_tool_call("enrich_activity", {"activity_file": activity_file}), map_details),
+    ]
+    logger.info(
+        f"Poem pipeline ran {len(calls)} tools in {(time.perf_counter() - start) * 1000:.0f}ms"
+    )
+
+    return [AIMessage(content="", tool_calls=[call for call, _ in calls])] + [
+        ToolMessage(content=output, name=call["name"], tool_call_id=call["id"])
+        for call, output in calls
+    ]
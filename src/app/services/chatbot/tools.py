@@ -1,34 +1,61 @@
 import json
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from src.app.services.chatbot import utils
+from src.app.services.chatbot import analytics, utils
 from src.app.services.googlemaps.client import GMapsClient
 from src.app.services.strava.client import StravaClient, get_access_token
 
 
 TOOL_CALL_MESSAGES: Dict = {
     "fetch_activities": "Fetching activities...",
+    "analyse_activities": "Crunching the numbers...",
     "select_activity": "Selecting activity...",
     "read_activity": "Reading activity...",
     "enrich_activity": "Enriching activity...",
     "update_activity": "Updating activity...",
+    "update_activities": "Updating activities...",
 }
 
+# Most activities one bulk update may change, to stay well inside Strava's rate limits
+MAX_BULK_UPDATES = 30
 
-def fetch_activities(query: str) -> str:
+# Strava caps a page at 200 activities, so this is 2000 activities of history at most
+MAX_ACTIVITY_PAGES = 10
+
+
+def fetch_activities(query: str, days_ago: int = 7) -> str:
     """Retrieve a list of the user's past activities from Strava.
 
     Args:
         query (str): A natural language question or query from the user.
+        days_ago (int): How many days of history to fetch. Default is 7, use more
+            (e.g. 31 or 90) for questions about months or trends.
 
     Returns:
-        str: A filename containing the activities JSON.
+        str: A filename containing the activities JSON, followed by a note if the
+            history was too long to fetch in full.
     """
     location = "data/activities.json"
     s = StravaClient(get_access_token())
-    activities = s.fetch_activities()
+    # the default of 30 is enough for a week, longer ranges page through 200 at a time
+    per_page = 30 if days_ago <= 7 else 200
+    activities = []
+    for page in range(1, MAX_ACTIVITY_PAGES + 1):
+        batch = s.fetch_activities(days_ago=days_ago, per_page=per_page, page=page)
+        activities.extend(batch)
+        if len(batch) < per_page:
+            truncated = False
+            break
+    else:
+        truncated = True
+
     with open(location, "w") as f:
         json.dump(activities, f)
+    if truncated:
+        return (
+            f"{location}\nNote: only the first {len(activities)} activities of the "
+            f"last {days_ago} days were fetched, the history is truncated."
+        )
     return location
 
 
@@ -67,6 +94,25 @@ def select_activity(query: str, activities_file: str) -> Tuple[bool, str]:
     return found_activity, activity_file
 
 
+def analyse_activities(activities_file: str, activity_type: str = "Run") -> str:
+    """Summarises activity history: weekly and monthly volume, pace trend, personal
+    bests and streaks.
+
+    Use this for aggregate questions (e.g. "how far did I run this month", "am I
+    getting faster") instead of reading the raw activities.
+
+    Args:
+        activities_file (str): The filename containing activities data.
+        activity_type (str): The type of activity to summarise. Default is "Run".
+
+    Returns:
+        str: Small tables with the computed statistics.
+    """
+    with open(activities_file, "r") as f:
+        activities = json.load(f)
+    return analytics.summarise_activities(activities, activity_type)
+
+
 def read_activity(activity_file: str) -> str:
     """Reads and displays the selected activity, including distance, time, and other data.
 
@@ -118,11 +164,63 @@ def update_activity(activity_file: str, new_description: str) -> str:
     return response
 
 
+def bulk_update_error(updates: List[utils.ActivityUpdate]) -> Optional[str]:
+    """
+    Why a bulk update can't be run as asked, or None if it can. Checked before the user
+    is asked to confirm it, so they never confirm something that is then refused.
+    """
+    if len(updates) > MAX_BULK_UPDATES:
+        return (
+            f"Too many activities, at most {MAX_BULK_UPDATES} can be updated at once."
+        )
+
+    activity_ids = [u.get("activity_id") for u in updates]
+    duplicates = list(
+        dict.fromkeys(i for i in activity_ids if activity_ids.count(i) > 1)
+    )
+    if duplicates:
+        return (
+            "Each activity can only be updated once, these were given more than once: "
+            f"{', '.join(str(i) for i in duplicates)}."
+        )
+    return None
+
+
+def update_activities(updates: List[utils.ActivityUpdate]) -> str:
+    """Updates the descriptions of several activities at once using the Strava API.
+
+    Use this instead of calling update_activity repeatedly, e.g. to tag a week of runs.
+    The user confirms all of the updates together.
+
+    Args:
+        updates (List[ActivityUpdate]): The activity IDs and their new descriptions.
+
+    Returns:
+        str: Which activities were updated, and why any of them failed.
+    """
+    if (error := bulk_update_error(updates)) is not None:
+        return error
+
+    s = StravaClient(get_access_token())
+    results = s.update_activities(
+        {u["activity_id"]: u["new_description"] for u in updates}
+    )
+
+    updated = sum(result["ok"] for result in results.values())
+    lines = [f"Updated {updated} of {len(results)} activities."]
+    for activity_id, result in results.items():
+        status = "updated" if result["ok"] else f"failed: {result['error']}"
+        lines.append(f"- {activity_id}: {status}")
+    return "\n".join(lines)
+
+
 def get_tools():
     return [
         fetch_activities,
+        analyse_activities,
         select_activity,
         read_activity,
         enrich_activity,
         update_activity,
+        update_activities,
     ]
@@ -2,13 +2,14 @@ import json
 from datetime import datetime
 from typing import Dict, List
 
-from langchain_openai import ChatOpenAI
 from typing_extensions import Annotated, TypedDict
 
 from src.app.services.chatbot.prompts import ACTIVITY_SELECTION_INSTRUCTIONS
+from src.app.utils.cancellation import raise_if_cancelled
+from src.app.utils.deadline import call_timeout
 
 
-MODEL_NAME = "gpt-4o-mini"
+SELECTION_TIMEOUT = 20.0
 
 
 class Activity(TypedDict):
@@ -29,9 +30,23 @@ class Activity(TypedDict):
     map: Annotated[Dict, ..., "Map information from the activity"]
 
 
+class ActivityUpdate(TypedDict):
+    """A new description for a Strava activity."""
+
+    activity_id: Annotated[int, ..., "The activity ID"]
+    new_description: Annotated[str, ..., "The new description of the activity"]
+
+
 def select_activity_llm(query: str, activities: List[Dict]) -> Activity:
-    llm = ChatOpenAI(model=MODEL_NAME)
-    structured_llm = llm.with_structured_output(Activity)
+    # imported here so that importing the tools doesn't pull in langchain
+    from src.app.services.chatbot.models import get_model
+
+    raise_if_cancelled()
+    structured_llm = get_model(
+        "select_activity",
+        call_timeout(SELECTION_TIMEOUT),
+        prepare=lambda llm: llm.with_structured_output(Activity),
+    )
     return structured_llm.invoke(
         f"""
         You are a helpful assistant you searches through a json of activity information,
@@ -1,11 +1,42 @@
 import os
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextvars import copy_context
+from typing import Dict, List, Optional, Tuple, Union
 
-import googlemaps
 import polyline
-from dotenv import load_dotenv
+import requests
 
-load_dotenv()
+from src.app.utils.cache import TTLCache
+from src.app.utils.cancellation import raise_if_cancelled
+from src.app.utils.deadline import call_timeout
+from src.app.utils.env import load_env
+from src.app.utils.progress import report_progress
+
+# A route's streets and landmarks don't change, so enrichment results are kept for a day
+_map_details_cache = TTLCache(ttl=24 * 60 * 60)
+# Street names of the road place ids found by snapping routes to roads
+_street_names_cache = TTLCache(ttl=24 * 60 * 60, maxsize=4096)
+
+# The Roads API snaps at most 100 points per request
+ROADS_BATCH_SIZE = 100
+# Roads named at once when snapping a route, a long run can cross dozens of them
+STREET_NAME_CONCURRENCY = 8
+
+# Upper bound on a single Maps request, it gets shorter as the turn's deadline nears
+REQUEST_TIMEOUT = 5.0
+# Upper bound on the time googlemaps spends retrying a request internally
+RETRY_TIMEOUT = 15.0
+
+# Threads for hedged reverse geocode requests
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gmaps-hedge")
+
+
+class _DeadlineSession(requests.Session):
+    """A session whose requests time out in line with the turn's deadline."""
+
+    def request(self, method, url, **kwargs):
+        kwargs["timeout"] = call_timeout(REQUEST_TIMEOUT)
+        return super().request(method, url, **kwargs)
 
 
 def select_equidistant_elements(data: List, n: int = 10) -> List:
@@ -18,32 +49,191 @@ def select_equidistant_elements(data: List, n: int = 10) -> List:
 
 
 class GMapsClient:
-    def __init__(self):
-        self.client = googlemaps.Client(key=os.getenv("GOOGLE_MAPS_API_KEY"))
+    def __init__(
+        self, hedge_after: Optional[float] = None, enrichment_mode: Optional[str] = None
+    ):
+        """
+        Args:
+            hedge_after (float): If a reverse geocode request hasn't answered after this
+                many seconds, send a duplicate and use whichever answers first. Defaults
+                to `GOOGLE_MAPS_HEDGE_AFTER` from the environment, or no hedging.
+            enrichment_mode (str): How `fetch_map_details` finds street names, either
+                "geocode" or "roads". Defaults to `GOOGLE_MAPS_ENRICHMENT_MODE` from the
+                environment, or "geocode".
+        """
+        # imported here so that importing the tools doesn't pull in googlemaps
+        import googlemaps
+
+        load_env()
+        self.client = googlemaps.Client(
+            key=os.getenv("GOOGLE_MAPS_API_KEY"),
+            base_url=os.getenv("GOOGLE_MAPS_API_URL", "https://maps.googleapis.com"),
+            retry_timeout=call_timeout(RETRY_TIMEOUT),
+            requests_session=_DeadlineSession(),
+        )
+        if hedge_after is None and os.getenv("GOOGLE_MAPS_HEDGE_AFTER"):
+            hedge_after = float(os.getenv("GOOGLE_MAPS_HEDGE_AFTER"))
+        self.hedge_after = hedge_after
+        self.enrichment_mode = enrichment_mode or os.getenv(
+            "GOOGLE_MAPS_ENRICHMENT_MODE", "geocode"
+        )
+        if os.getenv("GOOGLE_MAPS_ROADS_URL"):
+            # only for pointing the load test at its fake Roads API, googlemaps has no
+            # option for it
+            googlemaps.roads._ROADS_BASE_URL = os.getenv("GOOGLE_MAPS_ROADS_URL")
+
+    def _reverse_geocode(self, latlng: Union[Tuple[float, float], str]) -> List[Dict]:
+        """
+        Reverse geocode a point or a place id, hedged with a second request if the first one is slow. Reverse
+        geocoding is read only, so the duplicate is harmless.
+        """
+        if not self.hedge_after:
+            return self.client.reverse_geocode(latlng)
+
+        # each request needs its own copy of the context to see the turn's deadline
+        primary = _hedge_pool.submit(
+            copy_context().run, self.client.reverse_geocode, latlng
+        )
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        hedge = _hedge_pool.submit(
+            copy_context().run, self.client.reverse_geocode, latlng
+        )
+        error = None
+        for future in as_completed([primary, hedge]):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
+
+    def _snap_to_roads(self, path: List[Tuple[float, float]]) -> List[Dict]:
+        # interpolated, so that short roads between two points of the path aren't missed
+        from googlemaps.roads import snap_to_roads
 
-    def fetch_map_details(self, run_polyline: str, landmarks: bool = True) -> str:
+        return snap_to_roads(self.client, path, interpolate=True)
+
+    def _street_name(self, place_id: str) -> str:
+        if (name := _street_names_cache.get(place_id)) is not None:
+            return name
+
+        name = ""
+        results = self._reverse_geocode(place_id)
+        if results:
+            components = results[0].get("address_components", [])
+            name = next(
+                (c["long_name"] for c in components if "route" in c.get("types", [])),
+                results[0].get("formatted_address", ""),
+            )
+        _street_names_cache.set(place_id, name)
+        return name
+
+    def fetch_streets(self, coordinates: List[Tuple[float, float]]) -> List[str]:
+        """
+        Every street along a route, in the order they were run, by snapping the whole
+        route to roads (in batches of up to 100 points, overlapping by one so the
+        stretch between two batches is snapped too) and looking up the name of each
+        road once, a few at a time.
+
+        Args:
+            coordinates (List[Tuple[float, float]]): The decoded route.
+        Returns:
+            List[str]: Street names, without consecutive repeats.
+        """
+        # consecutive points on the same road share a place id
+        if not coordinates:
+            return []
+
+        place_ids = []
+        batches = range(0, max(len(coordinates) - 1, 1), ROADS_BATCH_SIZE - 1)
+        for i, start in enumerate(batches, 1):
+            raise_if_cancelled()
+            batch = coordinates[start : start + ROADS_BATCH_SIZE]
+            for point in self._snap_to_roads(batch):
+                place_id = point.get("placeId")
+                if place_id and (not place_ids or place_ids[-1] != place_id):
+                    place_ids.append(place_id)
+            report_progress(f"Snapped {i}/{len(batches)} parts of the route to roads")
+
+        def street_name(place_id: str) -> str:
+            raise_if_cancelled()
+            return self._street_name(place_id)
+
+        names = {}
+        unique_place_ids = list(dict.fromkeys(place_ids))
+        with ThreadPoolExecutor(max_workers=STREET_NAME_CONCURRENCY) as pool:
+            # each lookup needs its own copy of the context to see the turn's deadline
+            # and cancellation
+            futures = {
+                pool.submit(copy_context().run, street_name, place_id): place_id
+                for place_id in unique_place_ids
+            }
+            for i, future in enumerate(as_completed(futures), 1):
+                if future.exception() is not None:
+                    # don't start the lookups that are still queued
+                    pool.shutdown(cancel_futures=True)
+                names[futures[future]] = future.result()
+                # in route order, however the lookups finished
+                found = [names[p] for p in unique_place_ids if names.get(p)]
+                report_progress(
+                    f"Named {i}/{len(unique_place_ids)} roads",
+                    streets=list(dict.fromkeys(found)),
+                )
+
+        # different place ids (e.g. two stretches of a road) can share a name
+        streets = []
+        for place_id in place_ids:
+            name = names[place_id]
+            if name and (not streets or streets[-1] != name):
+                streets.append(name)
+        return streets
+
+    def fetch_map_details(
+        self, run_polyline: str, landmarks: bool = True, mode: Optional[str] = None
+    ) -> str:
         """
         Fetch nearby street names and landmarks based on the map data.
         Args:
             run_polyline (str): The input map data containing polyline.
+            landmarks (bool): Whether to also look for landmarks along the route.
+            mode (str): "geocode" reverse geocodes 10 points along the route, "roads"
+                lists every street on it with `fetch_streets`. Defaults to the client's
+                `enrichment_mode`.
         Returns:
             str: A formatted string with street names and landmarks.
         """
+        mode = mode or self.enrichment_mode
+        cache_key = (run_polyline, landmarks, mode)
+        if (details := _map_details_cache.get(cache_key)) is not None:
+            return details
+
         # Decode the polyline into a list of coordinates
         coordinates = polyline.decode(run_polyline)
 
+        # with roads, the streets come from the whole route rather than the 10 points
+        results = self.fetch_streets(coordinates) if mode == "roads" else []
+
         # select 10 equally spaced coordinates from the map
         coordinates = select_equidistant_elements(coordinates, 10)
 
-        results = []
-        for lat, lng in coordinates:
-            reverse_geocode = self.client.reverse_geocode((lat, lng))
+        streets = []
+        for i, (lat, lng) in enumerate(coordinates, 1):
+            raise_if_cancelled()
+            reverse_geocode = (
+                self._reverse_geocode((lat, lng)) if mode != "roads" else None
+            )
             if reverse_geocode:
                 # Extract street names
                 address = reverse_geocode[0].get(
                     "formatted_address", "Unknown Location"
                 )
                 results.append(f"{address}")
+                streets.append(address)
+                report_progress(
+                    f"Geocoded {i}/{len(coordinates)} points", streets=streets[:]
+                )
 
             if landmarks:
                 # Optionally fetch landmarks. TODO: make this better. It should recognise if I ran around a local park
@@ -61,4 +251,6 @@ class GMapsClient:
                 if places:
                     _ = [results.append(p["name"]) for p in places[:3]]
 
-        return "\n".join(results)
+        details = "\n".join(results)
+        _map_details_cache.set(cache_key, details)
+        return details
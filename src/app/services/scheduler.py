@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional, Set
+
+from src.app.utils.deadline import DeadlineExceeded, remaining
+
+
+class QueueFull(Exception):
+    """Raised when there is no room to queue another call. Retry after `retry_after`s."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many requests, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class FairScheduler:
+    """
+    A bounded number of slots for model and tool calls, shared by every user. When all
+    slots are busy, callers wait in per-user queues that are served round-robin, so one
+    user firing off lots of calls can't starve everyone else. When the wait queue is
+    full, `QueueFull` is raised straight away instead of queueing.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 64):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._active = 0
+        self._queued = 0
+        # user_id -> their waiting calls. Users are served in the order of this dict,
+        # and go to the back once they've been given a slot
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # moving average of how long a slot is held, for retry hints
+        self._avg_hold = 1.0
+
+    def is_full(self) -> bool:
+        return self._active >= self.max_concurrency and self._queued >= self.max_queue
+
+    def retry_after(self) -> float:
+        """Rough estimate of how long until the queue has drained a little."""
+        backlog = (self._queued + 1) / self.max_concurrency
+        return max(1.0, round(backlog * self._avg_hold, 1))
+
+    @asynccontextmanager
+    async def slot(self, user_id: str) -> AsyncIterator[None]:
+        await self._acquire(user_id)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_hold = 0.9 * self._avg_hold + 0.1 * (time.monotonic() - start)
+            self._release()
+
+    async def _acquire(self, user_id: str) -> None:
+        if self._active < self.max_concurrency and not self._queued:
+            self._active += 1
+            return
+        if self._queued >= self.max_queue:
+            raise QueueFull(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        try:
+            # no point waiting for a slot past the turn's deadline
+            await asyncio.wait_for(waiter, timeout=remaining())
+        except (asyncio.CancelledError, TimeoutError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # given a slot just as we were cancelled, pass it on
+                self._release()
+            else:
+                self._remove_waiter(user_id, waiter)
+            if isinstance(e, TimeoutError):
+                raise DeadlineExceeded("Timed out waiting for the assistant") from e
+            raise
+
+    def _remove_waiter(self, user_id: str, waiter: asyncio.Future) -> None:
+        queue = self._waiters.get(user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._waiters[user_id]
+
+    def _release(self) -> None:
+        self._active -= 1
+        while self._waiters and self._active < self.max_concurrency:
+            user_id, queue = self._waiters.popitem(last=False)
+            waiter = queue.popleft()
+            self._queued -= 1
+            if queue:
+                # back of the line for this user's next call
+                self._waiters[user_id] = queue
+            if not waiter.done():
+                self._active += 1
+                waiter.set_result(None)
+
+
+class UserRuns:
+    """Tracks which users have a graph run in progress, to allow one at a time each."""
+
+    def __init__(self):
+        self._running: Set[str] = set()
+
+    def try_start(self, user_id: str) -> bool:
+        if user_id in self._running:
+            return False
+        self._running.add(user_id)
+        return True
+
+    def finish(self, user_id: str) -> None:
+        self._running.discard(user_id)
+
+
+_scheduler: Optional[FairScheduler] = None
+user_runs = UserRuns()
+
+
+def get_scheduler() -> FairScheduler:
+    """
+    The process-wide scheduler, sized by `MAX_CONCURRENT_CALLS` and `MAX_QUEUED_CALLS`.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairScheduler(
+            max_concurrency=int(os.getenv("MAX_CONCURRENT_CALLS", "8")),
+            max_queue=int(os.getenv("MAX_QUEUED_CALLS", "64")),
+        )
+    return _scheduler
@@ -1,8 +1,51 @@
 import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from datetime import datetime, timedelta
+from typing import Dict
 
 import requests
 
+from src.app.utils.cache import TTLCache
+from src.app.utils.cancellation import raise_if_cancelled
+from src.app.utils.deadline import DeadlineExceeded, call_timeout, retry
+from src.app.utils.progress import report_progress
+
+# Recently fetched activity lists, so a warm-up or a repeated question doesn't go back
+# to Strava (and use up rate limit) for the same page
+_activities_cache = TTLCache(ttl=300)
+
+# Upper bound on a single Strava request, it gets shorter as the turn's deadline nears
+REQUEST_TIMEOUT = 10.0
+# Responses worth retrying a GET for. Not 429, Strava's limits reset every 15 minutes
+# so retrying within a turn only uses up more of the limit
+RETRY_STATUSES = {500, 502, 503, 504}
+# Concurrent PUTs in a bulk update. Strava allows 100-200 requests per 15 minutes, so
+# this is kept small to leave room for everything else
+BULK_UPDATE_CONCURRENCY = 4
+
+
+def rate_limit_reached(response: requests.Response) -> bool:
+    """
+    Whether a response says the app has used up a Strava rate limit, from its
+    `X-RateLimit-Usage` and `X-RateLimit-Limit` headers ("15 minute,daily" counts).
+    """
+    if response.status_code == 429:
+        return True
+    usage = response.headers.get("X-RateLimit-Usage")
+    limit = response.headers.get("X-RateLimit-Limit")
+    if not usage or not limit:
+        return False
+    try:
+        return any(
+            int(used) >= int(allowed)
+            for used, allowed in zip(usage.split(","), limit.split(","))
+        )
+    except ValueError:
+        return False
+
 
 # TODO: improve user token storage. Also make it so that it handles multiple
 # users. Maybe via cookies?
@@ -13,14 +56,48 @@ def get_access_token() -> str:
 
 class StravaClient:
     def __init__(self, access_token: str):
-        self.base_url = "https://www.strava.com/api/v3"
+        # overridable so the app can be pointed at a fake Strava, e.g. for load tests
+        self.base_url = os.getenv("STRAVA_API_URL", "https://www.strava.com/api/v3")
         self.access_token = access_token
         self.headers = {
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json",
         }
 
-    def fetch_activities(self, days_ago: int = 7, per_page: int = 30, page: int = 1) -> list:
+    def _get(self, path: str, params: dict) -> requests.Response:
+        """
+        GET with a timeout taken from the turn's deadline, retried with jitter on
+        connection errors, timeouts and server errors.
+        """
+
+        def attempt() -> requests.Response:
+            raise_if_cancelled()
+            response = requests.get(
+                f"{self.base_url}{path}",
+                headers=self.headers,
+                params=params,
+                timeout=call_timeout(REQUEST_TIMEOUT),
+            )
+            if response.status_code in RETRY_STATUSES:
+                response.raise_for_status()
+            return response
+
+        return retry(
+            attempt,
+            retry_on=(
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.HTTPError,
+            ),
+        )
+
+    def fetch_activities(
+        self,
+        days_ago: int = 7,
+        per_page: int = 30,
+        page: int = 1,
+        use_cache: bool = True,
+    ) -> list:
         """
         Fetches a list of activities from the Strava API.
 
@@ -28,24 +105,40 @@ class StravaClient:
             days_ago (int): The number of days back to look when fetching activities. Default is 7.
             per_page (int): The number of activities to fetch per page. Default is 30.
             page (int): The page number to fetch. Default is 1.
+            use_cache (bool): Whether a list fetched in the last few minutes can be reused.
 
         Returns:
             list: A list of activities in JSON format.
         """
+        cache_key = (self.access_token, days_ago, per_page, page)
+        if use_cache and (activities := _activities_cache.get(cache_key)) is not None:
+            return activities
+
         try:
             time_range = datetime.now() - timedelta(days=days_ago)
             after = int(time_range.timestamp())
 
-            response = requests.get(
-                f"{self.base_url}/athlete/activities",
-                headers=self.headers,
+            response = self._get(
+                "/athlete/activities",
                 params={"per_page": per_page, "page": page, "after": after},
             )
             response.raise_for_status()
-            return response.json()
+            activities = response.json()
+            _activities_cache.set(cache_key, activities)
+            return activities
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to fetch activities: {str(e)}")
 
+    def _put_description(self, activity_id: int, description: str) -> requests.Response:
+        # not retried, a PUT that timed out may still have been applied
+        raise_if_cancelled()
+        return requests.put(
+            f"{self.base_url}/activities/{activity_id}",
+            headers=self.headers,
+            json={"description": description},
+            timeout=call_timeout(REQUEST_TIMEOUT),
+        )
+
     def update_activity(self, activity_id: int, description: str) -> dict:
         """
         Updates the description of an existing activity.
@@ -61,12 +154,64 @@ class StravaClient:
             raise ValueError("Activity ID must be a positive integer")
 
         try:
-            response = requests.put(
-                f"{self.base_url}/activities/{activity_id}",
-                headers=self.headers,
-                json={"description": description},
-            )
+            response = self._put_description(activity_id, description)
             response.raise_for_status()
+            # cached lists may now be out of date
+            _activities_cache.clear()
             return response.json()
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to update activity: {str(e)}")
+
+    def update_activities(self, descriptions: Dict[int, str]) -> Dict[int, Dict]:
+        """
+        Updates the descriptions of several activities, a few requests at a time. Once
+        Strava reports that a rate limit has been reached, the remaining updates are
+        skipped rather than sent.
+
+        Args:
+            descriptions (Dict[int, str]): The new description for each activity ID.
+
+        Returns:
+            Dict[int, Dict]: For each activity ID, `{"ok": True}` or `{"ok": False,
+                "error": ...}`.
+        """
+        rate_limited = threading.Event()
+        done = []
+
+        def update(activity_id: int, description: str) -> Dict:
+            if not isinstance(activity_id, int) or activity_id <= 0:
+                return {"ok": False, "error": "Activity ID must be a positive integer"}
+            if rate_limited.is_set():
+                return {
+                    "ok": False,
+                    "error": "Skipped, Strava's rate limit was reached",
+                }
+            try:
+                response = self._put_description(activity_id, description)
+            except (requests.exceptions.RequestException, DeadlineExceeded) as e:
+                return {"ok": False, "error": str(e)}
+            finally:
+                done.append(activity_id)
+                report_progress(f"Finished {len(done)}/{len(descriptions)} updates")
+
+            if rate_limit_reached(response):
+                rate_limited.set()
+            if not response.ok:
+                return {
+                    "ok": False,
+                    "error": f"{response.status_code} {response.reason}",
+                }
+            return {"ok": True}
+
+        with ThreadPoolExecutor(max_workers=BULK_UPDATE_CONCURRENCY) as pool:
+            # each update needs its own copy of the context to see the turn's
+            # deadline and cancellation
+            futures = {
+                activity_id: pool.submit(
+                    copy_context().run, update, activity_id, description
+                )
+                for activity_id, description in descriptions.items()
+            }
+        # cached lists may now be out of date
+        _activities_cache.clear()
+        return {activity_id: future.result() for activity_id, future in futures.items()}
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import time
+
+from src.app.services.googlemaps.client import GMapsClient
+from src.app.services.strava.client import StravaClient, get_access_token
+from src.app.utils.logger import setup_logger
+
+logger = setup_logger(name="warmup", level=logging.INFO, log_file="chat.log")
+
+
+async def warm_up_user(user_id: str) -> None:
+    """
+    Get everything a user's first message needs ready in the background: their chat
+    graph, their recent activities and the streets of their latest route. These all
+    end up in in-memory caches that the tools read from.
+
+    Args:
+        user_id (str): The ID of the user who has just authenticated
+    """
+    # imported here to keep langchain/langgraph out of the auth route's imports
+    from src.app.services.chatbot.graph import get_chat_graph
+
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(get_chat_graph, user_id)
+
+        # same arguments as the fetch_activities tool uses by default, so it hits the
+        # cache
+        activities = await asyncio.to_thread(
+            StravaClient(get_access_token()).fetch_activities
+        )
+        if activities and (route := activities[-1]["map"].get("summary_polyline")):
+            await asyncio.to_thread(GMapsClient().fetch_map_details, route)
+
+        logger.info(
+            f"Warmed up user {user_id} in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+    except Exception as e:
+        # the chat still works without it, just more slowly
+        logger.warning(f"Warm-up failed for user {user_id}: {e}")
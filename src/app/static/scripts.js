@@ -1,6 +1,100 @@
 const form = document.getElementById('chat-form');
 const chatHistory = document.getElementById('chat-history');
 
+// One WebSocket carries messages, streamed replies, interrupts and confirmations
+let socket = null;
+let agentMessage = null;
+let statusMessage = null;
+
+function connect() {
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    socket = new WebSocket(`${protocol}://${window.location.host}/chat/ws`);
+
+    socket.onmessage = (event) => {
+        try {
+            const parsedResponse = JSON.parse(event.data);
+            console.log("Parsed response:", parsedResponse);
+            handleEvent(parsedResponse);
+        } catch (e) {
+            console.error("Error parsing message:", e);
+        }
+    };
+
+    socket.onclose = () => console.log("WebSocket closed, will reconnect on the next message");
+
+    return waitForOpen();
+}
+
+function waitForOpen() {
+    return new Promise((resolve) => socket.addEventListener('open', resolve, { once: true }));
+}
+
+async function send(payload) {
+    if (!socket || socket.readyState >= WebSocket.CLOSING) {
+        await connect();
+    } else if (socket.readyState === WebSocket.CONNECTING) {
+        await waitForOpen();
+    }
+    socket.send(JSON.stringify(payload));
+}
+
+function removeStatusMessage() {
+    if (statusMessage) {
+        statusMessage.remove();
+        statusMessage = null;
+    }
+}
+
+function handleEvent(parsedResponse) {
+    if (parsedResponse.error) {
+        removeStatusMessage();
+        const errorDiv = document.createElement('div');
+        errorDiv.textContent = `Error: ${parsedResponse.error}`;
+        errorDiv.className = 'system-message error';
+        chatHistory.appendChild(errorDiv);
+    } else if (parsedResponse.interrupt) {
+        removeStatusMessage();
+        agentMessage = null;
+        handleInterrupt(parsedResponse);
+    } else if (parsedResponse.tool_status) {
+        // Replace any existing status message
+        removeStatusMessage();
+        agentMessage = null;
+        statusMessage = document.createElement('div');
+        statusMessage.className = 'agent-message status-message';
+        statusMessage.innerHTML = `
+            <strong>Agent:</strong>
+            <span class="loading-spinner"></span>
+            ${parsedResponse.tool_status}
+        `;
+        if (parsedResponse.streets) {
+            // Partial results from the tool, e.g. the streets of the route found so far
+            const streets = document.createElement('div');
+            streets.className = 'status-streets';
+            streets.textContent = parsedResponse.streets.join(' → ');
+            statusMessage.appendChild(streets);
+        }
+        chatHistory.appendChild(statusMessage);
+    } else if (parsedResponse.message) {
+        // Show the reply as it is generated
+        removeStatusMessage();
+        if (!agentMessage) {
+            agentMessage = document.createElement('div');
+            agentMessage.className = 'agent-message';
+            agentMessage.style.whiteSpace = 'pre-wrap';
+            chatHistory.appendChild(agentMessage);
+        }
+        agentMessage.innerHTML = `<strong>Agent:</strong> ${parsedResponse.message}`;
+    }
+
+    if (parsedResponse.done) {
+        removeStatusMessage();
+        agentMessage = null;
+    }
+
+    chatHistory.scrollTop = chatHistory.scrollHeight;
+}
+
 form.onsubmit = async function (event) {
     event.preventDefault();
 
@@ -16,99 +110,10 @@ form.onsubmit = async function (event) {
 
     // Clear input
     messageInput.value = '';
+    agentMessage = null;
 
     try {
-        const response = await fetch('/chat/message_stream', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ content: message })
-        });
-
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
-        }
-
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-
-        let finalMessage = '';
-        let statusMessage = null;
-
-        while (true) {
-            const { value, done } = await reader.read();
-            if (done) break;
-
-            const text = decoder.decode(value);
-            console.log("Received text:", text);
-
-            const messages = text.split('\n').filter(line => line.trim());
-
-            for (const message of messages) {
-                try {
-                    const parsedResponse = JSON.parse(message);
-                    console.log("Parsed response:", parsedResponse);
-
-                    // Update final message but don't display yet
-                    if (parsedResponse.message) {
-                        finalMessage = parsedResponse.message;
-                    }
-
-                    // Handle tool status updates
-                    if (parsedResponse.tool_status) {
-                        // Remove existing status message if it exists
-                        if (statusMessage) {
-                            statusMessage.remove();
-                        }
-                        // Create new status message
-                        statusMessage = document.createElement('div');
-                        statusMessage.className = 'agent-message status-message';
-                        statusMessage.innerHTML = `
-                            <strong>Agent:</strong> 
-                            <span class="loading-spinner"></span>
-                            ${parsedResponse.tool_status}
-                        `;
-                        chatHistory.appendChild(statusMessage);
-                    }
-
-                    if (parsedResponse.interrupt) {
-                        if (statusMessage) {
-                            statusMessage.remove();
-                        }
-                        await handleInterrupt(parsedResponse);
-                        return;
-                    }
-
-                    if (parsedResponse.error) {
-                        const errorDiv = document.createElement('div');
-                        errorDiv.textContent = `Error: ${parsedResponse.error}`;
-                        errorDiv.className = 'system-message error';
-                        chatHistory.appendChild(errorDiv);
-                    }
-                } catch (e) {
-                    console.error("Error parsing message:", e);
-                }
-            }
-
-            chatHistory.scrollTop = chatHistory.scrollHeight;
-        }
-
-        // Remove status message when done
-        if (statusMessage) {
-            statusMessage.remove();
-        }
-
-        // Add final message only at the end
-        if (finalMessage) {
-            const agentMessage = document.createElement('div');
-            agentMessage.className = 'agent-message';
-            agentMessage.style.whiteSpace = 'pre-wrap';
-            agentMessage.innerHTML = `<strong>Agent:</strong> ${finalMessage}`;
-            chatHistory.appendChild(agentMessage);
-            chatHistory.scrollTop = chatHistory.scrollHeight;
-        }
-
+        await send({ content: message });
     } catch (error) {
         console.error("Error:", error);
         const errorDiv = document.createElement('div');
@@ -121,7 +126,7 @@ form.onsubmit = async function (event) {
 };
 
 
-async function handleInterrupt(interruptData) {
+function handleInterrupt(interruptData) {
     const interruptMessage = document.createElement('div');
     interruptMessage.textContent = interruptData.message;
     interruptMessage.className = 'interrupt-message';
@@ -139,23 +144,13 @@ async function handleInterrupt(interruptData) {
         button.className = isConfirm ? 'confirm-button' : 'cancel-button';
         button.onclick = async () => {
             buttonContainer.remove();
-            const response = await fetch('/chat/confirm', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    confirmed: isConfirm,
-                    user_id: 'test-user-1' // TODO: Replace with actual user ID
-                })
-            });
-
-            if (response.ok) {
-                const data = await response.json();
-                interruptMessage.style.whiteSpace = 'pre-wrap';
-                interruptMessage.textContent = data.message;
-            }
+            // The resumed run streams back over the same socket
+            await send({ confirmed: isConfirm });
         };
         return button;
     }
 
     chatHistory.scrollTop = chatHistory.scrollHeight;
-}
\ No newline at end of file
+}
+
+connect();
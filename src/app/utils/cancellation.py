@@ -0,0 +1,32 @@
+import threading
+from contextvars import ContextVar
+from typing import Optional
+
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar(
+    "cancel_event", default=None
+)
+
+
+class OperationCancelled(Exception):
+    """Raised inside tools when the graph run they belong to has been cancelled."""
+
+
+def new_cancellation_scope() -> threading.Event:
+    """
+    Start a cancellation scope for the current graph run. The returned event is seen by
+    everything the run spawns, including tools running in worker threads (asyncio and
+    langchain copy the context into them), and setting it asks them to stop.
+    """
+    event = threading.Event()
+    _cancel_event.set(event)
+    return event
+
+
+def raise_if_cancelled() -> None:
+    """
+    Call before any slow or billable outbound call. Threads can't be interrupted, so
+    this is how a cancelled run stops a tool between requests.
+    """
+    event = _cancel_event.get()
+    if event is not None and event.is_set():
+        raise OperationCancelled("The run was cancelled")
@@ -0,0 +1,75 @@
+import os
+import random
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+# How long a whole chat turn (every model, tool and HTTP call in it) may take by default
+DEFAULT_TURN_DEADLINE_SECONDS = 90.0
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the current turn has run out of time."""
+
+
+def start_deadline(seconds: Optional[float] = None) -> None:
+    """
+    Start the time budget for a chat turn. Like the cancellation scope, it is seen by
+    everything the turn spawns, including tools running in worker threads.
+
+    Args:
+        seconds (float): The budget. Defaults to `TURN_DEADLINE_SECONDS` from the
+            environment, or 90s.
+    """
+    if seconds is None:
+        seconds = float(
+            os.getenv("TURN_DEADLINE_SECONDS", DEFAULT_TURN_DEADLINE_SECONDS)
+        )
+    _deadline.set(time.monotonic() + seconds)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current turn, or None outside of a turn."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def call_timeout(cap: float) -> float:
+    """
+    The timeout for a single outbound call: `cap`, or whatever is left of the turn if
+    that's less.
+
+    Raises:
+        DeadlineExceeded: If the turn has no time left.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded("The request took too long")
+    return min(cap, left)
+
+
+def retry(
+    fn: Callable[[], T],
+    retry_on: Tuple[Type[BaseException], ...],
+    attempts: int = 3,
+    base_delay: float = 0.25,
+) -> T:
+    """
+    Call `fn`, retrying on `retry_on` with jittered exponential backoff. Only use this
+    for idempotent calls. Stops early if the next attempt wouldn't fit in the turn.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except retry_on:
+            delay = base_delay * 2**attempt * random.uniform(0.5, 1.5)
+            left = remaining()
+            if attempt == attempts - 1 or (left is not None and left <= delay):
+                raise
+            time.sleep(delay)
@@ -0,0 +1,12 @@
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=None)
+def load_env() -> None:
+    """
+    Load the `.env` file into the environment. Safe to call from anywhere, only the
+    first call does any work.
+    """
+    load_dotenv()
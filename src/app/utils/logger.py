@@ -66,9 +66,10 @@ def setup_logger(
     console_handler.setFormatter(console_formatter)
     logger.addHandler(console_handler)
 
-    # File handler if specified (without colors)
+    # File handler if specified (without colors). The file is only opened on the first
+    # record, so that importing a module with a logger doesn't touch the disk
     if log_file:
-        file_handler = logging.FileHandler(log_file)
+        file_handler = logging.FileHandler(log_file, delay=True)
         file_formatter = logging.Formatter(format_string, datefmt=datefmt)
         file_handler.setFormatter(file_formatter)
         logger.addHandler(file_handler)
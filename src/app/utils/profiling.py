@@ -0,0 +1,82 @@
+"""
+Cold start report for the app: how long importing `src.app.main` takes (and which
+modules are responsible), and how long until `/health` answers.
+
+Run with:
+    poetry run python -m src.app.utils.profiling
+"""
+
+import argparse
+import subprocess
+import sys
+from typing import List, Tuple
+
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import src.app.main
+imported = time.perf_counter()
+# not part of the app's startup, so it's left out of the timings
+from fastapi.testclient import TestClient
+lifespan_start = time.perf_counter()
+with TestClient(src.app.main.app) as client:
+    started = time.perf_counter()
+    client.get("/health").raise_for_status()
+    healthy = time.perf_counter()
+print(f"{imported - start} {started - lifespan_start} {healthy - started}")
+"""
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Parses the output of `python -X importtime` into (module, self_us, cumulative_us).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:") :].split("|")
+            rows.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def main(top: int = 15) -> None:
+    importtime = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.app.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = parse_importtime(importtime.stderr)
+
+    startup = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_s, lifespan_s, health_s = map(float, startup.stdout.split()[-3:])
+
+    print("Cold start")
+    print(f"  import src.app.main: {import_s * 1000:8.1f} ms")
+    print(f"  lifespan startup:    {lifespan_s * 1000:8.1f} ms")
+    print(f"  first /health:       {health_s * 1000:8.1f} ms")
+    print(f"  total:               {(import_s + lifespan_s + health_s) * 1000:8.1f} ms")
+    print()
+    print(f"Top {top} imports by cumulative time")
+    # only top level packages, nested ones are already counted in their parent
+    top_level = {}
+    for module, _, cumulative_us in rows:
+        package = module.split(".")[0]
+        top_level[package] = max(top_level.get(package, 0), cumulative_us)
+    for package, cumulative_us in sorted(top_level.items(), key=lambda x: -x[1])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {package}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--top", type=int, default=15)
+    main(parser.parse_args().top)
@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional
+
+_writer: ContextVar[Optional[Callable[[Dict], None]]] = ContextVar(
+    "progress_writer", default=None
+)
+
+
+@contextmanager
+def progress_scope(writer: Callable[[Dict], None], tool: str) -> Iterator[None]:
+    """
+    Send progress reported while a tool runs to `writer` (a graph node's stream
+    writer), tagged with the tool's name. Like the cancellation scope, it is seen by
+    tools running in worker threads.
+    """
+    token = _writer.set(lambda event: writer({"tool": tool, **event}))
+    try:
+        yield
+    finally:
+        _writer.reset(token)
+
+
+@contextmanager
+def without_progress() -> Iterator[None]:
+    """
+    Drop progress reported inside this block, e.g. by speculative work whose results
+    may never be shown to the user.
+    """
+    token = _writer.set(None)
+    try:
+        yield
+    finally:
+        _writer.reset(token)
+
+
+def report_progress(message: str, **partial) -> None:
+    """
+    Report how far a slow tool has got, e.g. `report_progress("Geocoded 4/10 points",
+    streets=[...])`, with any partial results as keyword arguments. Does nothing
+    outside of a progress scope, so tools can call it unconditionally.
+    """
+    writer = _writer.get()
+    if writer is not None:
+        writer({"message": message, **partial})
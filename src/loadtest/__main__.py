@@ -0,0 +1,3 @@
+from src.loadtest.runner import main
+
+main()
@@ -0,0 +1,306 @@
+"""
+Local stand-ins for the Strava, Google Maps and OpenAI APIs, with configurable
+latency, so the app can be load tested without touching (or paying for) the real ones.
+"""
+
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import polyline
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+POEM = """Down Regent Street the morning light,
+Past Hyde Park gates I took my flight,
+Along the Serpentine I sped,
+With Kensington's bright lamps ahead.
+Each stride a verse, each breath a rhyme,
+I raced the river, beat the time,
+Then home again through Marble Arch,
+A poet's pace, a runner's march."""
+
+
+@dataclass
+class FakeLatency:
+    """Simulated upstream latencies, in seconds."""
+
+    strava: float = 0.15
+    maps: float = 0.08
+    llm_first_token: float = 0.4
+    llm_per_token: float = 0.02
+
+
+def _jitter(seconds: float) -> float:
+    return seconds * random.uniform(0.8, 1.2)
+
+
+def fake_activities(n: int = 10) -> List[Dict]:
+    now = datetime.now()
+    activities = []
+    for i in range(n):
+        # a small loop around central London, shifted a little for each activity
+        path = [
+            (51.5074 + 0.001 * j + 0.0005 * i, -0.1278 + 0.0015 * j) for j in range(40)
+        ]
+        activities.append(
+            {
+                "id": 1000 + i,
+                "name": f"Morning Run {i + 1}",
+                "type": "Run",
+                "distance": 5000.0 + 250 * i,
+                "moving_time": 1500 + 60 * i,
+                "elapsed_time": 1560 + 60 * i,
+                "total_elevation_gain": 12.0 + i,
+                "start_date_local": (now - timedelta(days=n - i)).strftime(
+                    "%Y-%m-%dT%H:%M:%SZ"
+                ),
+                "kudos_count": i,
+                "photo_count": 0,
+                "map": {"summary_polyline": polyline.encode(path)},
+            }
+        )
+    return activities
+
+
+def fake_strava_app(latency: FakeLatency, rate_limit: int = 10_000) -> FastAPI:
+    app = FastAPI()
+    activities = fake_activities()
+    usage = {"requests": 0}
+
+    @app.get("/api/v3/athlete/activities")
+    async def list_activities():
+        await asyncio.sleep(_jitter(latency.strava))
+        return activities
+
+    @app.put("/api/v3/activities/{activity_id}")
+    async def update_activity(activity_id: int, request: Request):
+        await asyncio.sleep(_jitter(latency.strava))
+        usage["requests"] += 1
+        headers = {
+            "X-RateLimit-Limit": f"{rate_limit},{rate_limit * 10}",
+            "X-RateLimit-Usage": f"{usage['requests']},{usage['requests']}",
+        }
+        if usage["requests"] > rate_limit:
+            return JSONResponse(
+                {"message": "Rate Limit Exceeded"}, status_code=429, headers=headers
+            )
+        body = await request.json()
+        activity = next((a for a in activities if a["id"] == activity_id), {})
+        return JSONResponse(
+            {**activity, "description": body.get("description", "")}, headers=headers
+        )
+
+    return app
+
+
+def fake_maps_app(latency: FakeLatency) -> FastAPI:
+    app = FastAPI()
+    streets = ["Regent Street", "Oxford Street", "Park Lane", "The Mall", "Strand"]
+
+    @app.get("/maps/api/geocode/json")
+    async def reverse_geocode(
+        latlng: Optional[str] = None, place_id: Optional[str] = None
+    ):
+        await asyncio.sleep(_jitter(latency.maps))
+        if place_id:
+            # road place ids from snapToRoads, see below
+            street = streets[int(place_id.rsplit("-", 1)[1]) % len(streets)]
+        else:
+            street = random.choice(streets)
+        return {
+            "status": "OK",
+            "results": [
+                {
+                    "formatted_address": f"{street}, London, UK",
+                    "address_components": [{"long_name": street, "types": ["route"]}],
+                }
+            ],
+        }
+
+    @app.get("/v1/snapToRoads")
+    async def snap_to_roads(path: str, interpolate: bool = False):
+        await asyncio.sleep(_jitter(latency.maps))
+        points = [point.split(",") for point in path.split("|")]
+        snapped = []
+        for i, (lat, lng) in enumerate(points):
+            # a new road every 8 points
+            place_id = f"fake-road-{i // 8}"
+            if interpolate and i > 0:
+                # interpolated points have no originalIndex
+                snapped.append(
+                    {"location": snapped[-1]["location"], "placeId": place_id}
+                )
+            snapped.append(
+                {
+                    "location": {"latitude": float(lat), "longitude": float(lng)},
+                    "originalIndex": i,
+                    "placeId": place_id,
+                }
+            )
+        return {"snappedPoints": snapped}
+
+    @app.get("/maps/api/place/nearbysearch/json")
+    async def places_nearby():
+        await asyncio.sleep(_jitter(latency.maps))
+        return {
+            "status": "OK",
+            "results": [
+                {"name": "Hyde Park", "types": ["park", "tourist_attraction"]},
+            ],
+        }
+
+    return app
+
+
+def _choose_reply(body: Dict) -> Dict:
+    """
+    Decide what the fake model answers: structured output when a tool is forced,
+    a tool call when the user asks for something that needs one, otherwise text.
+    """
+    tool_choice = body.get("tool_choice")
+    if isinstance(tool_choice, dict):
+        # structured output, e.g. `select_activity_llm`
+        name = tool_choice["function"]["name"]
+        return {"tool_call": (name, fake_activities()[-1])}
+
+    messages = body.get("messages", [])
+    last = messages[-1] if messages else {}
+    content = last.get("content") or ""
+    tools = {t["function"]["name"] for t in body.get("tools", [])}
+
+    if last.get("role") == "user":
+        lowered = content.lower()
+        if "update all" in lowered and "update_activities" in tools:
+            updates = [
+                {"activity_id": a["id"], "new_description": "Tagged by running-buddy"}
+                for a in fake_activities()[-5:]
+            ]
+            return {"tool_call": ("update_activities", {"updates": updates})}
+        if "update" in lowered and "update_activity" in tools:
+            return {
+                "tool_call": (
+                    "update_activity",
+                    {
+                        "activity_file": "data/selected_activity.json",
+                        "new_description": POEM + "\n\nGenerated by running-buddy :)",
+                    },
+                )
+            }
+        if ("run" in lowered or "poem" in lowered) and "fetch_activities" in tools:
+            return {"tool_call": ("fetch_activities", {"query": content})}
+        return {"text": "Hello! Ask me about your runs, or for a poem about one."}
+
+    if last.get("role") == "tool":
+        if any(
+            m.get("name") in ("update_activity", "update_activities")
+            for m in messages[-3:]
+        ):
+            return {"text": "Done, your activity description has been updated."}
+
+        # like the real model, go through the poem tools one at a time when they
+        # weren't all run by the planner
+        calls = next(
+            (m["tool_calls"] for m in reversed(messages) if m.get("tool_calls")), []
+        )
+        previous = calls[-1]["function"]["name"] if calls else None
+        query = next(
+            (m.get("content") for m in reversed(messages) if m.get("role") == "user"),
+            "",
+        )
+        activity_file = "data/selected_activity.json"
+        if previous == "fetch_activities" and "select_activity" in tools:
+            return {
+                "tool_call": (
+                    "select_activity",
+                    {"query": query, "activities_file": last.get("content")},
+                )
+            }
+        if previous == "select_activity" and "read_activity" in tools:
+            return {"tool_call": ("read_activity", {"activity_file": activity_file})}
+        if previous == "read_activity" and "enrich_activity" in tools:
+            return {"tool_call": ("enrich_activity", {"activity_file": activity_file})}
+        return {"text": POEM}
+
+    return {"text": "Okay!"}
+
+
+def fake_openai_app(latency: FakeLatency) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        reply = _choose_reply(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o-mini")
+
+        tool_calls = None
+        text = reply.get("text")
+        if "tool_call" in reply:
+            name, args = reply["tool_call"]
+            tool_calls = [
+                {
+                    "index": 0,
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": name, "arguments": json.dumps(args)},
+                }
+            ]
+        tokens = text.split(" ") if text else []
+        usage = {
+            "prompt_tokens": len(json.dumps(body.get("messages", []))) // 4,
+            "completion_tokens": max(len(tokens), 1),
+            "total_tokens": len(json.dumps(body.get("messages", []))) // 4
+            + max(len(tokens), 1),
+        }
+        finish_reason = "tool_calls" if tool_calls else "stop"
+
+        if not body.get("stream"):
+            await asyncio.sleep(
+                _jitter(latency.llm_first_token + latency.llm_per_token * len(tokens))
+            )
+            message = {"role": "assistant", "content": text, "tool_calls": tool_calls}
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {"index": 0, "message": message, "finish_reason": finish_reason}
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        def chunk(delta: Dict, finish: Optional[str] = None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(_jitter(latency.llm_first_token))
+            yield chunk({"role": "assistant", "content": ""})
+            if tool_calls:
+                yield chunk({"tool_calls": tool_calls})
+            for i, token in enumerate(tokens):
+                await asyncio.sleep(_jitter(latency.llm_per_token))
+                yield chunk({"content": token if i == 0 else " " + token})
+            yield chunk({}, finish_reason)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
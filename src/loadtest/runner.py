@@ -0,0 +1,314 @@
+"""
+Concurrency load test: simulates N users holding scripted conversations (including an
+update confirmation) against the app over its WebSocket, with Strava, Google Maps and
+OpenAI replaced by local fakes. Reports throughput, time-to-first-token and total
+latency percentiles, and memory growth of the app process per active session.
+
+Run with:
+    poetry run python -m src.loadtest --users 50
+
+Each simulated user has its own conversation (picked with the `X-User-Id` header, which
+the app only honours because the runner sets `TRUST_USER_ID_HEADER`), but the tools
+still write to the shared data/activities.json and data/selected_activity.json in the
+app's working directory. Concurrent users can overwrite each other's files between two
+tool calls, so a turn can occasionally act on another user's activity; the timings are
+still representative, the replies aren't.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import uvicorn
+from websockets.asyncio.client import connect
+
+from src.loadtest.fakes import (
+    FakeLatency,
+    fake_maps_app,
+    fake_openai_app,
+    fake_strava_app,
+)
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# (kind, payload) pairs sent by every simulated user, in order
+SCRIPT: List[Tuple[str, object]] = [
+    ("content", "Hi there!"),
+    ("content", "Write me a poem about my latest run"),
+    ("content", "Please update my activity description with that poem"),
+    ("confirmed", True),
+]
+
+
+@dataclass
+class TurnResult:
+    kind: str
+    ttft: Optional[float]
+    total: float
+    error: Optional[str] = None
+    # index of the turn in SCRIPT
+    step: Optional[int] = None
+
+
+@dataclass
+class LoadTestResult:
+    users: int
+    wall_time: float
+    turns: List[TurnResult] = field(default_factory=list)
+    rss_baseline_kb: int = 0
+    rss_peak_kb: int = 0
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_kb(pid: int) -> int:
+    """Resident set size of a process, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        pass
+    return 0
+
+
+async def _serve(app, port: int) -> Tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def _wait_for_app(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"App did not start on port {port}")
+
+
+async def _run_turn(ws, kind: str, payload: object) -> TurnResult:
+    start = time.perf_counter()
+    ttft = None
+    await ws.send(json.dumps({kind: payload}))
+    while True:
+        event = json.loads(await ws.recv())
+        if event.get("error"):
+            return TurnResult(kind, ttft, time.perf_counter() - start, event["error"])
+        if ttft is None and event.get("message") and not event.get("interrupt"):
+            ttft = time.perf_counter() - start
+        if event.get("done") or event.get("interrupt"):
+            return TurnResult(kind, ttft, time.perf_counter() - start)
+
+
+async def _run_user(
+    url: str, user_id: str, iterations: int, think_time: float
+) -> List[TurnResult]:
+    results = []
+    try:
+        async with connect(url, additional_headers={"X-User-Id": user_id}) as ws:
+            for _ in range(iterations):
+                for step, (kind, payload) in enumerate(SCRIPT):
+                    result = await _run_turn(ws, kind, payload)
+                    result.step = step
+                    results.append(result)
+                    await asyncio.sleep(think_time)
+    except Exception as e:
+        results.append(TurnResult("connection", None, 0.0, repr(e)))
+    return results
+
+
+async def _sample_rss(pid: int, result: LoadTestResult, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        result.rss_peak_kb = max(result.rss_peak_kb, _rss_kb(pid))
+        await asyncio.sleep(0.1)
+
+
+async def run_load_test(
+    users: int,
+    iterations: int = 1,
+    think_time: float = 0.5,
+    ramp_up: float = 1.0,
+    latency: Optional[FakeLatency] = None,
+) -> LoadTestResult:
+    """
+    Start the fakes and the app (in a subprocess, so its memory can be measured on its
+    own), then run `users` concurrent scripted conversations against it.
+
+    Args:
+        users (int): The number of simultaneous users to simulate.
+        iterations (int): How many times each user runs through the script.
+        think_time (float): Seconds each user waits between turns.
+        ramp_up (float): Seconds over which the users are started.
+        latency (FakeLatency): Simulated upstream latencies.
+
+    Returns:
+        LoadTestResult: Timings for every turn plus the app's memory usage.
+    """
+    latency = latency or FakeLatency()
+    strava_port, maps_port, openai_port, app_port = (_free_port() for _ in range(4))
+    fakes = [
+        await _serve(fake_strava_app(latency), strava_port),
+        await _serve(fake_maps_app(latency), maps_port),
+        await _serve(fake_openai_app(latency), openai_port),
+    ]
+
+    # the app keeps its token storage, data files and logs in its working directory
+    workdir = tempfile.mkdtemp(prefix="running-buddy-loadtest-")
+    os.makedirs(os.path.join(workdir, "data"))
+    with open(os.path.join(workdir, "token_storage.json"), "w") as f:
+        json.dump({"access_token": "fake", "refresh_token": "fake", "expires_at": 0}, f)
+
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(REPO_ROOT),
+        "STRAVA_API_URL": f"http://127.0.0.1:{strava_port}/api/v3",
+        "GOOGLE_MAPS_API_URL": f"http://127.0.0.1:{maps_port}",
+        "GOOGLE_MAPS_ROADS_URL": f"http://127.0.0.1:{maps_port}",
+        "GOOGLE_MAPS_API_KEY": "AIzaFakeLoadTestKey",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "OPENAI_API_KEY": "sk-fake",
+        "TRUST_USER_ID_HEADER": "1",
+    }
+    app_process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "src.app.main:app",
+            "--port",
+            str(app_port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+    try:
+        await _wait_for_app(app_port)
+        url = f"ws://127.0.0.1:{app_port}/chat/ws"
+
+        # one conversation up front so imports and first-use costs aren't measured
+        await _run_user(url, "warm-up-user", 1, 0.0)
+        result = LoadTestResult(users=users, wall_time=0.0)
+        result.rss_baseline_kb = _rss_kb(app_process.pid)
+
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(_sample_rss(app_process.pid, result, stop))
+
+        async def delayed_user(i: int) -> List[TurnResult]:
+            await asyncio.sleep(ramp_up * i / max(users, 1))
+            return await _run_user(url, f"load-user-{i}", iterations, think_time)
+
+        start = time.perf_counter()
+        per_user = await asyncio.gather(*(delayed_user(i) for i in range(users)))
+        result.wall_time = time.perf_counter() - start
+        result.turns = [turn for turns in per_user for turn in turns]
+
+        stop.set()
+        await sampler
+        return result
+
+    finally:
+        app_process.terminate()
+        app_process.wait()
+        for server, _ in fakes:
+            server.should_exit = True
+        await asyncio.gather(*(task for _, task in fakes))
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": float("nan"), "p95": float("nan"), "p99": float("nan")}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+def format_report(result: LoadTestResult) -> str:
+    ok = [t for t in result.turns if not t.error]
+    errors = [t for t in result.turns if t.error]
+    # only turns that stream a reply have a first token, confirmation prompts don't
+    streamed = [t for t in ok if t.ttft is not None]
+    ttft = _percentiles([t.ttft for t in streamed])
+    total = _percentiles([t.total for t in ok])
+    growth_kb = max(result.rss_peak_kb - result.rss_baseline_kb, 0)
+
+    lines = [
+        f"Users:            {result.users}",
+        f"Turns:            {len(ok)} ok, {len(errors)} failed",
+        f"Wall time:        {result.wall_time:.1f} s",
+        (
+            f"Throughput:       {len(ok) / result.wall_time:.2f} turns/s"
+            if result.wall_time
+            else "Throughput:       -"
+        ),
+        f"Time to first token (s, {len(streamed)} streamed turns):  "
+        + "  ".join(f"{k} {v:.3f}" for k, v in ttft.items()),
+        f"Total latency (s, all {len(ok)} turns):          "
+        + "  ".join(f"{k} {v:.3f}" for k, v in total.items()),
+        f"RSS baseline:     {result.rss_baseline_kb / 1024:.1f} MiB",
+        f"RSS peak:         {result.rss_peak_kb / 1024:.1f} MiB",
+        f"RSS per session:  {growth_kb / max(result.users, 1):.1f} KiB",
+    ]
+    for step, (kind, payload) in enumerate(SCRIPT):
+        step_total = _percentiles([t.total for t in ok if t.step == step])
+        lines.append(
+            f"  {str(payload)[:24]:<24} total  "
+            + "  ".join(f"{k} {v:.3f}" for k, v in step_total.items())
+        )
+    if errors:
+        lines.append("First errors:")
+        lines += [f"  {t.kind}: {t.error}" for t in errors[:5]]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=1)
+    parser.add_argument("--think-time", type=float, default=0.5)
+    parser.add_argument("--ramp-up", type=float, default=1.0)
+    parser.add_argument("--strava-latency", type=float, default=0.15)
+    parser.add_argument("--maps-latency", type=float, default=0.08)
+    parser.add_argument("--llm-first-token", type=float, default=0.4)
+    parser.add_argument("--llm-per-token", type=float, default=0.02)
+    args = parser.parse_args()
+
+    latency = FakeLatency(
+        strava=args.strava_latency,
+        maps=args.maps_latency,
+        llm_first_token=args.llm_first_token,
+        llm_per_token=args.llm_per_token,
+    )
+    result = asyncio.run(
+        run_load_test(
+            args.users, args.iterations, args.think_time, args.ramp_up, latency
+        )
+    )
+    print(format_report(result))
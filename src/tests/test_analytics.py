@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+import pytest
+
+from src.app.services.chatbot.analytics import (
+    _pace_trend,
+    _parse_runs,
+    _streaks,
+    _weekly_volume,
+    summarise_activities,
+)
+
+MONDAY = date(2026, 1, 5)
+
+
+def run(day: date, km: float = 5.0, pace: float = 300.0, name: str = "Run") -> dict:
+    return {
+        "type": "Run",
+        "name": name,
+        "distance": km * 1000,
+        "moving_time": int(km * pace),
+        "start_date_local": f"{day.isoformat()}T08:00:00Z",
+    }
+
+
+def rows(*runs: dict) -> list:
+    return _parse_runs(list(runs), "Run")
+
+
+def test_weekly_volume_groups_by_monday():
+    weekly = _weekly_volume(
+        rows(run(MONDAY), run(MONDAY + timedelta(days=6)), run(MONDAY + timedelta(7)))
+    )
+    assert [(week, count) for week, count, _, _ in weekly] == [
+        ("2026-01-05", 2),
+        ("2026-01-12", 1),
+    ]
+    assert weekly[0][2] == 10.0
+
+
+def test_weekly_volume_keeps_empty_weeks():
+    weekly = _weekly_volume(rows(run(MONDAY), run(MONDAY + timedelta(weeks=3))))
+    assert [count for _, count, _, _ in weekly] == [1, 0, 0, 1]
+    assert weekly[1] == ("2026-01-12", 0, 0.0, 0)
+
+
+def test_pace_trend_uses_week_offsets_across_gaps():
+    # 2 s/km faster every week, with no runs in weeks 2 to 8
+    weeks = [0, 1, 9]
+    weekly = _weekly_volume(
+        rows(*(run(MONDAY + timedelta(weeks=w), pace=300 - 2 * w) for w in weeks))
+    )
+    assert _pace_trend(weekly) == pytest.approx(-2.0)
+
+
+def test_pace_trend_needs_two_weeks():
+    assert _pace_trend(_weekly_volume(rows(run(MONDAY), run(MONDAY)))) is None
+
+
+def test_summary_reports_span_in_weeks():
+    summary = summarise_activities(
+        [run(MONDAY + timedelta(weeks=w), pace=300 - 2 * w) for w in (0, 1, 9)],
+        today=MONDAY + timedelta(weeks=10),
+    )
+    assert "2.0 s/km per week faster across 10 weeks" in summary
+
+
+def test_streaks():
+    days = [MONDAY, MONDAY + timedelta(1), MONDAY + timedelta(2), MONDAY + timedelta(5)]
+    assert _streaks(days, today=MONDAY + timedelta(6)) == (1, 3)
+    # the last run was two days ago, so the current streak is over
+    assert _streaks(days, today=MONDAY + timedelta(7)) == (0, 3)
+
+
+def test_summary_without_matching_activities():
+    ride = {**run(MONDAY), "type": "Ride"}
+    assert summarise_activities([ride]) == "No Run activities found."
@@ -0,0 +1,35 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.app.api.routes import chat
+from src.app.main import app
+
+
+@pytest.fixture
+def websocket(monkeypatch):
+    # keep chat.log out of the working directory
+    handlers = [
+        h for h in chat.logger.handlers if not isinstance(h, logging.FileHandler)
+    ]
+    monkeypatch.setattr(chat.logger, "handlers", handlers)
+    # the chat graph is created on connect, but these messages never reach it
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    # the client's context waits for the handler to finish, while the logger is patched
+    with TestClient(app) as client, client.websocket_connect("/chat/ws") as websocket:
+        yield websocket
+
+
+def test_malformed_messages_get_an_error_and_keep_the_connection(websocket):
+    websocket.send_text("not json")
+    assert websocket.receive_json() == {"error": "Messages must be JSON objects"}
+
+    websocket.send_bytes(b"\xff")
+    assert websocket.receive_json() == {"error": "Messages must be JSON objects"}
+
+    websocket.send_json(["content"])
+    assert websocket.receive_json() == {"error": "Messages must be JSON objects"}
+
+    websocket.send_json({"hello": "there"})
+    assert websocket.receive_json() == {"error": "Expected `content` or `confirmed`"}
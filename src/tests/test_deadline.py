@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from src.app.utils import deadline
+from src.app.utils.deadline import (
+    DeadlineExceeded,
+    call_timeout,
+    remaining,
+    retry,
+    start_deadline,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_deadline():
+    # start_deadline sets a context variable, don't let it leak into other tests
+    token = deadline._deadline.set(None)
+    yield
+    deadline._deadline.reset(token)
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    sleeps = []
+    monkeypatch.setattr(deadline.time, "sleep", sleeps.append)
+    monkeypatch.setattr(deadline.random, "uniform", lambda low, high: 1.0)
+    return sleeps
+
+
+def failing(times: int, error: type = ConnectionError):
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) <= times:
+            raise error("nope")
+        return "ok"
+
+    return fn, calls
+
+
+def test_call_timeout_outside_a_turn_is_the_cap():
+    assert remaining() is None
+    assert call_timeout(5.0) == 5.0
+
+
+def test_call_timeout_shrinks_to_what_is_left_of_the_turn():
+    start_deadline(2.0)
+    assert call_timeout(10.0) <= 2.0
+    assert call_timeout(1.0) == 1.0
+
+
+def test_call_timeout_raises_once_the_turn_is_out_of_time():
+    start_deadline(0.0)
+    with pytest.raises(DeadlineExceeded):
+        call_timeout(5.0)
+
+
+def test_retry_backs_off_until_it_succeeds(sleeps):
+    fn, calls = failing(2)
+    assert retry(fn, retry_on=(ConnectionError,), base_delay=0.25) == "ok"
+    assert len(calls) == 3
+    assert sleeps == [0.25, 0.5]
+
+
+def test_retry_gives_up_after_the_last_attempt(sleeps):
+    fn, calls = failing(5)
+    with pytest.raises(ConnectionError):
+        retry(fn, retry_on=(ConnectionError,), attempts=3)
+    assert len(calls) == 3
+
+
+def test_retry_only_retries_the_given_errors(sleeps):
+    fn, calls = failing(1, error=ValueError)
+    with pytest.raises(ValueError):
+        retry(fn, retry_on=(ConnectionError,))
+    assert len(calls) == 1
+
+
+def test_retry_stops_when_the_backoff_would_not_fit_in_the_turn(sleeps):
+    start_deadline(0.1)
+    fn, calls = failing(1)
+    with pytest.raises(ConnectionError):
+        retry(fn, retry_on=(ConnectionError,), base_delay=0.25)
+    assert len(calls) == 1
+    assert sleeps == []
@@ -0,0 +1,72 @@
+from typing import Dict, List
+
+import pytest
+
+from src.app.services.googlemaps.client import GMapsClient
+
+
+@pytest.fixture
+def client(monkeypatch) -> GMapsClient:
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "AIzaFakeTestKey")
+    return GMapsClient(enrichment_mode="roads")
+
+
+def route(n: int) -> List[tuple]:
+    return [(51.5 + i / 10_000, -0.1) for i in range(n)]
+
+
+def fake_roads(
+    monkeypatch, client: GMapsClient, place_ids: Dict[int, str], names: Dict[str, str]
+):
+    """
+    Snap each point to `place_ids[i]` (by its index in the route) and name each road
+    from `names`, recording the batches sent and the roads looked up.
+    """
+    coordinates = route(max(place_ids) + 1)
+    batches, looked_up = [], []
+
+    def snap_to_roads(path):
+        batches.append(path)
+        return [{"placeId": place_ids.get(coordinates.index(p))} for p in path]
+
+    def street_name(place_id):
+        looked_up.append(place_id)
+        return names[place_id]
+
+    monkeypatch.setattr(client, "_snap_to_roads", snap_to_roads)
+    monkeypatch.setattr(client, "_street_name", street_name)
+    return coordinates, batches, looked_up
+
+
+def test_batches_overlap_by_one_point(client, monkeypatch):
+    coordinates, batches, _ = fake_roads(
+        monkeypatch, client, {i: "road" for i in range(250)}, {"road": "Strand"}
+    )
+    client.fetch_streets(coordinates)
+
+    assert [len(batch) for batch in batches] == [100, 100, 52]
+    assert batches[1][0] == batches[0][-1] == coordinates[99]
+    assert batches[2][0] == batches[1][-1] == coordinates[198]
+    assert batches[2][-1] == coordinates[-1]
+
+
+def test_short_and_empty_routes(client, monkeypatch):
+    coordinates, batches, _ = fake_roads(
+        monkeypatch, client, {i: "road" for i in range(100)}, {"road": "Strand"}
+    )
+    assert client.fetch_streets(coordinates) == ["Strand"]
+    assert len(batches) == 1
+    assert client.fetch_streets([]) == []
+    assert len(batches) == 1
+
+
+def test_roads_are_named_once_and_repeats_collapsed(client, monkeypatch):
+    # a road split across the batch boundary, a point that didn't snap, two stretches
+    # of the same street, and a road without a name
+    place_ids = {i: "p1" for i in range(0, 101)}
+    place_ids.update({101: None, 102: "p2", 103: "p3", 104: "p4", 105: "p5", 106: "p1"})
+    names = {"p1": "Strand", "p2": "Mall", "p3": "Mall", "p4": "", "p5": "Strand"}
+    coordinates, _, looked_up = fake_roads(monkeypatch, client, place_ids, names)
+
+    assert client.fetch_streets(coordinates) == ["Strand", "Mall", "Strand"]
+    assert sorted(looked_up) == ["p1", "p2", "p3", "p4", "p5"]
@@ -0,0 +1,144 @@
+import asyncio
+from typing import List, Optional
+
+import pytest
+
+from src.app.services.scheduler import FairScheduler, QueueFull, UserRuns
+from src.app.utils.deadline import DeadlineExceeded, start_deadline
+
+
+def run(main):
+    # a leaked slot would otherwise leave a waiter hanging forever
+    return asyncio.run(asyncio.wait_for(main, timeout=5))
+
+
+async def call(
+    scheduler: FairScheduler,
+    user_id: str,
+    name: str,
+    order: List[str],
+    gate: Optional[asyncio.Event] = None,
+) -> None:
+    async with scheduler.slot(user_id):
+        order.append(name)
+        if gate is not None:
+            await gate.wait()
+
+
+def test_waiting_users_are_served_round_robin():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        order, gate = [], asyncio.Event()
+        tasks = [asyncio.create_task(call(scheduler, "A", "A0", order, gate))]
+        await asyncio.sleep(0)
+        for user_id, name in [("A", "A1"), ("A", "A2"), ("B", "B0")]:
+            tasks.append(asyncio.create_task(call(scheduler, user_id, name, order)))
+        await asyncio.sleep(0)
+
+        gate.set()
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = run(main())
+    # B0 doesn't wait behind all of A's calls
+    assert order == ["A0", "A1", "B0", "A2"]
+    assert (scheduler._active, scheduler._queued) == (0, 0)
+
+
+def test_queue_full_once_every_slot_and_queue_place_is_taken():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=2)
+        order, gate = [], asyncio.Event()
+        tasks = [
+            asyncio.create_task(call(scheduler, user_id, user_id, order, gate))
+            for user_id in ("A", "B", "C")
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.is_full()
+
+        with pytest.raises(QueueFull) as e:
+            await call(scheduler, "D", "D", order)
+        assert e.value.retry_after >= 1.0
+
+        gate.set()
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = run(main())
+    assert order == ["A", "B", "C"]
+    assert not scheduler.is_full()
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        order, gate = [], asyncio.Event()
+        holder = asyncio.create_task(call(scheduler, "A", "A0", order, gate))
+        waiting = asyncio.create_task(call(scheduler, "B", "B0", order))
+        other = asyncio.create_task(call(scheduler, "C", "C0", order))
+        await asyncio.sleep(0)
+        assert scheduler._queued == 2
+
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler._queued == 1
+        assert "B" not in scheduler._waiters
+
+        gate.set()
+        await asyncio.gather(holder, other)
+        return order, scheduler
+
+    order, scheduler = run(main())
+    assert order == ["A0", "C0"]
+    assert (scheduler._active, scheduler._queued) == (0, 0)
+
+
+def test_slot_given_to_a_cancelled_waiter_is_passed_on():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        order = []
+        async with scheduler.slot("A"):
+            waiting = asyncio.create_task(call(scheduler, "B", "B0", order))
+            other = asyncio.create_task(call(scheduler, "C", "C0", order))
+            await asyncio.sleep(0)
+        # B has been handed the slot but hasn't run yet
+        waiting.cancel()
+
+        results = await asyncio.gather(waiting, other, return_exceptions=True)
+        assert isinstance(results[0], asyncio.CancelledError)
+        return order, scheduler
+
+    order, scheduler = run(main())
+    assert order == ["C0"]
+    assert (scheduler._active, scheduler._queued) == (0, 0)
+
+
+def test_waiting_stops_at_the_turn_deadline():
+    async def main():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        order, gate = [], asyncio.Event()
+        holder = asyncio.create_task(call(scheduler, "A", "A0", order, gate))
+        await asyncio.sleep(0)
+
+        start_deadline(0.05)
+        with pytest.raises(DeadlineExceeded):
+            await call(scheduler, "B", "B0", order)
+        assert scheduler._queued == 0
+
+        gate.set()
+        await holder
+        return order, scheduler
+
+    order, scheduler = run(main())
+    assert order == ["A0"]
+    assert scheduler._active == 0
+
+
+def test_user_runs_allow_one_run_per_user():
+    runs = UserRuns()
+    assert runs.try_start("A")
+    assert not runs.try_start("A")
+    assert runs.try_start("B")
+
+    runs.finish("A")
+    assert runs.try_start("A")
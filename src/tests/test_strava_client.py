@@ -0,0 +1,85 @@
+from typing import Dict, List, Tuple
+
+import requests
+
+from src.app.services.strava import client as strava
+from src.app.services.strava.client import StravaClient, rate_limit_reached
+
+
+def response(status: int = 200, usage: str = "", limit: str = "") -> requests.Response:
+    r = requests.Response()
+    r.status_code = status
+    r.reason = "Too Many Requests" if status == 429 else "OK"
+    if usage:
+        r.headers["X-RateLimit-Usage"] = usage
+    if limit:
+        r.headers["X-RateLimit-Limit"] = limit
+    return r
+
+
+def test_rate_limit_reached_on_429():
+    assert rate_limit_reached(response(429))
+
+
+def test_rate_limit_reached_from_headers():
+    assert not rate_limit_reached(response(usage="99,500", limit="100,1000"))
+    # either the 15 minute or the daily limit
+    assert rate_limit_reached(response(usage="100,500", limit="100,1000"))
+    assert rate_limit_reached(response(usage="10,1000", limit="100,1000"))
+
+
+def test_rate_limit_reached_ignores_missing_or_bad_headers():
+    assert not rate_limit_reached(response())
+    assert not rate_limit_reached(response(usage="10,20"))
+    assert not rate_limit_reached(response(usage="lots", limit="100,1000"))
+
+
+def client_with_responses(
+    monkeypatch, responses: List[requests.Response]
+) -> Tuple[StravaClient, List[int]]:
+    # one update at a time, so the responses are used in order
+    monkeypatch.setattr(strava, "BULK_UPDATE_CONCURRENCY", 1)
+    client = StravaClient("token")
+    sent = []
+
+    def put_description(activity_id: int, description: str) -> requests.Response:
+        sent.append(activity_id)
+        return responses[len(sent) - 1]
+
+    monkeypatch.setattr(client, "_put_description", put_description)
+    return client, sent
+
+
+def errors(results: Dict[int, Dict]) -> Dict[int, str]:
+    return {i: r.get("error", "") for i, r in results.items() if not r["ok"]}
+
+
+def test_update_activities_skips_the_rest_once_rate_limited(monkeypatch):
+    client, sent = client_with_responses(
+        monkeypatch,
+        [response(), response(usage="100,500", limit="100,1000")],
+    )
+    results = client.update_activities({1: "a", 2: "b", 3: "c", 4: "d"})
+
+    # the update that used up the limit still went through
+    assert sent == [1, 2]
+    assert results[1] == {"ok": True} and results[2] == {"ok": True}
+    assert set(errors(results)) == {3, 4}
+    assert "rate limit" in errors(results)[3]
+
+
+def test_update_activities_reports_a_429_and_stops(monkeypatch):
+    client, sent = client_with_responses(monkeypatch, [response(429)])
+    results = client.update_activities({1: "a", 2: "b"})
+
+    assert sent == [1]
+    assert errors(results)[1] == "429 Too Many Requests"
+    assert "rate limit" in errors(results)[2]
+
+
+def test_update_activities_rejects_invalid_ids_without_sending(monkeypatch):
+    client, sent = client_with_responses(monkeypatch, [response()])
+    results = client.update_activities({0: "a", 5: "b"})
+
+    assert sent == [5]
+    assert set(errors(results)) == {0}
@@ -0,0 +1,21 @@
+from src.app.services.chatbot.tools import MAX_BULK_UPDATES, bulk_update_error
+
+
+def update(activity_id: int) -> dict:
+    return {"activity_id": activity_id, "new_description": f"Run {activity_id}"}
+
+
+def test_bulk_update_error_allows_distinct_activities():
+    assert (
+        bulk_update_error([update(i) for i in range(1, MAX_BULK_UPDATES + 1)]) is None
+    )
+
+
+def test_bulk_update_error_rejects_too_many_activities():
+    error = bulk_update_error([update(i) for i in range(MAX_BULK_UPDATES + 1)])
+    assert error.startswith("Too many activities")
+
+
+def test_bulk_update_error_names_duplicates():
+    error = bulk_update_error([update(1), update(2), update(1), update(3), update(2)])
+    assert error.endswith("more than once: 1, 2.")